@@ -2,21 +2,44 @@ import type { LoaderFunctionArgs } from "@remix-run/node";
 import { authenticate } from "../shopify.server";
 import { env } from "../utils/env.server";
 
+// Conditional/range request headers forwarded to the backend
+const FORWARD_REQUEST_HEADERS = ["range", "if-none-match", "if-range"];
+// Validators and range headers passed back to the browser
+const FORWARD_RESPONSE_HEADERS = [
+  "content-type",
+  "content-disposition",
+  "content-length",
+  "content-range",
+  "accept-ranges",
+  "etag",
+  "last-modified",
+];
+
 // Admin-only proxy for backend assets, to avoid mixed content in HTTPS admin.
 // GET /api/assets/* -> streams from `${BACKEND_URL}/assets/*`
+// Content-hashed outputs are immutable upstream, so the browser may cache them
+// privately; everything else stays no-store.
 export const loader = async ({ request, params }: LoaderFunctionArgs) => {
   await authenticate.admin(request);
   const rest = params["*"] || "";
   const upstream = `${env.BACKEND_URL}/assets/${rest}`;
-  const res = await fetch(upstream);
-  const buf = await res.arrayBuffer();
-  const ct = res.headers.get("content-type") || "application/octet-stream";
-  const disp = res.headers.get("content-disposition");
-  const headers: Record<string, string> = {
-    "content-type": ct,
-    "cache-control": "no-store",
-  };
-  if (disp) headers["content-disposition"] = disp;
-  return new Response(buf, { status: res.status, headers });
+  // Ask for identity encoding so byte ranges and lengths match what we stream back
+  const upstreamHeaders: Record<string, string> = { "accept-encoding": "identity" };
+  for (const name of FORWARD_REQUEST_HEADERS) {
+    const value = request.headers.get(name);
+    if (value) upstreamHeaders[name] = value;
+  }
+  const res = await fetch(upstream, { headers: upstreamHeaders });
+  const headers: Record<string, string> = {};
+  for (const name of FORWARD_RESPONSE_HEADERS) {
+    const value = res.headers.get(name);
+    if (value) headers[name] = value;
+  }
+  if (!headers["content-type"]) headers["content-type"] = "application/octet-stream";
+  const upstreamCache = res.headers.get("cache-control") || "";
+  headers["cache-control"] = upstreamCache.includes("immutable")
+    ? "private, max-age=31536000, immutable"
+    : "no-store";
+  const body = res.status === 304 ? null : res.body;
+  return new Response(body, { status: res.status, headers });
 };
-
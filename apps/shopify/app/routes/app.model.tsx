@@ -37,7 +37,7 @@ export const loader = async ({ request }: LoaderFunctionArgs) => {
 
 export const action = async ({ request }: ActionFunctionArgs) => {
   try {
-    await authenticate.admin(request);
+    const { session } = await authenticate.admin(request);
     const form = await request.formData();
     const file = form.get("file");
     const height = form.get("height_cm");
@@ -51,6 +51,9 @@ export const action = async ({ request }: ActionFunctionArgs) => {
     if (typeof height === "string" && height.length > 0) {
       fd.append("height_cm", height);
     }
+    // Admin test runs go to the batch lane so they never delay storefront jobs
+    fd.append("shop", session.shop);
+    fd.append("priority", "batch");
 
     const res = await fetch(`${env.BACKEND_URL}/uploads`, {
       method: "POST",
@@ -8,6 +8,8 @@ import crypto from "node:crypto";
 // Height validation constants (must match backend)
 const HEIGHT_MIN_CM = 50;
 const HEIGHT_MAX_CM = 300;
+// Input views per job: front, then optionally side (must match backend)
+const MAX_INPUT_VIEWS = 2;
 
 function getOrCreateGuestId(headers: Headers): { id: string; setCookie?: string } {
   const cookie = headers.get("cookie") || "";
@@ -27,6 +29,9 @@ export const action = async ({ request }: ActionFunctionArgs) => {
   const heightCm: number | undefined = typeof body.height_cm === "number" ? body.height_cm : undefined;
   const customerIdRaw: string | undefined = typeof body.customer_id === "string" ? body.customer_id : undefined;
   if (!objectKeys.length) return json({ error: "Missing object_keys" }, { status: 400 });
+  if (objectKeys.length > MAX_INPUT_VIEWS) {
+    return json({ error: `At most ${MAX_INPUT_VIEWS} photos (front, side)` }, { status: 400 });
+  }
 
   // Validate height is within acceptable range
   if (heightCm !== undefined && (heightCm < HEIGHT_MIN_CM || heightCm > HEIGHT_MAX_CM)) {
@@ -102,7 +107,13 @@ export const action = async ({ request }: ActionFunctionArgs) => {
   const res = await fetch(`${env.BACKEND_URL}/enqueue`, {
     method: "POST",
     headers: { "content-type": "application/json" },
-    body: JSON.stringify({ job_id: jobId, input_key: objectKeys[0], height_cm: heightCm }),
+    body: JSON.stringify({
+      job_id: jobId,
+      input_keys: objectKeys,
+      height_cm: heightCm,
+      shop,
+      priority: "interactive",
+    }),
   });
   if (!res.ok) {
     const t = await res.text();
@@ -16,6 +16,10 @@ export const action = async ({ request }: ActionFunctionArgs) => {
   const fd = new FormData();
   fd.append("file", file);
   if (typeof height === "string" && height.length > 0) fd.append("height_cm", height);
+  // Storefront try-ons run in the backend's interactive lane, fair-shared per shop
+  const shop = new URL(request.url).searchParams.get("shop");
+  if (shop) fd.append("shop", shop);
+  fd.append("priority", "interactive");
 
   const res = await fetch(`${env.BACKEND_URL}/uploads`, { method: "POST", body: fd });
   const text = await res.text();
@@ -1,10 +1,20 @@
+import gzip
+import hashlib
+import json
 import logging
+import math
+import mimetypes
 import os
+import random
+import re
 import secrets
+import threading
 import time
 import uuid
-from datetime import datetime, timezone
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Literal, Optional
 
 # Optional S3 (R2-compatible) client
 import boto3
@@ -22,11 +32,27 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, field_validator
-from sqlalchemy import Column, DateTime, Float, String, Text, create_engine
+from fastapi.responses import FileResponse, JSONResponse, Response
+from pydantic import BaseModel, field_validator, model_validator
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    String,
+    Text,
+    create_engine,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+import metrics
+from scheduler import FairScheduler, parse_weights
+from worker_pool import WorkerPool
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -38,7 +64,7 @@ app = FastAPI()
 # Set BACKEND_API_KEY env var to enable authentication. In production, this should always be set.
 BACKEND_API_KEY = os.getenv("BACKEND_API_KEY")
 # Endpoints that don't require API key auth (health checks, asset serving)
-_PUBLIC_PATHS = frozenset(["/healthz", "/assets"])
+_PUBLIC_PATHS = frozenset(["/healthz", "/metrics", "/assets"])
 
 
 def _path_is_public(path: str) -> bool:
@@ -78,31 +104,116 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins + ["http://127.0.0.1:3000", "http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "X-API-Key", "X-Callback-Secret"],
+    allow_methods=["GET", "HEAD", "POST", "OPTIONS"],
+    allow_headers=[
+        "Content-Type",
+        "X-API-Key",
+        "X-Callback-Secret",
+        "Range",
+        "If-None-Match",
+        "If-Range",
+    ],
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges", "Content-Encoding"],
+)
+
+# --- Metrics (in-process registry, scraped via GET /metrics) ---
+HTTP_LATENCY = metrics.histogram(
+    "rapso_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+JOBS_BY_STATUS = metrics.gauge("rapso_jobs", "Jobs stored, by status", ("status",))
+QUEUE_DEPTH = metrics.gauge(
+    "rapso_queue_depth", "Jobs queued and not yet picked up by a worker"
+)
+STORAGE_LATENCY = metrics.histogram(
+    "rapso_storage_op_duration_seconds",
+    "Storage operation latency by backend (s3 or local)",
+    ("op", "backend"),
+)
+STORAGE_FALLBACKS = metrics.counter(
+    "rapso_storage_fallbacks_total",
+    "S3 operations that failed and fell back to local storage",
+    ("op",),
+)
+WORKER_DISPATCHES = metrics.counter(
+    "rapso_worker_dispatches_total",
+    "Job dispatch attempts by outcome (ok | error | deferred | no_worker | simulated)",
+    ("outcome",),
+)
+WORKER_CALLBACKS = metrics.counter(
+    "rapso_worker_callbacks_total",
+    "Job callbacks received from the worker",
+    ("status", "provider"),
 )
+APP_CALLBACKS = metrics.counter(
+    "rapso_app_callbacks_total",
+    "App callback delivery attempts, by outcome (ok | retry | dead)",
+    ("outcome",),
+)
+OUTBOX_PENDING = metrics.gauge(
+    "rapso_outbox_pending", "App callbacks waiting in the outbox for delivery"
+)
+SCHEDULED_JOBS = metrics.gauge(
+    "rapso_scheduled_jobs",
+    "Jobs held by the fair-share scheduler, by lane and state (queued | in_flight)",
+    ("lane", "state"),
+)
+GC_OBJECTS = metrics.counter(
+    "rapso_gc_objects_deleted_total",
+    "Objects deleted by the retention sweeper, by policy",
+    ("policy",),
+)
+GC_BYTES = metrics.counter(
+    "rapso_gc_bytes_reclaimed_total",
+    "Bytes reclaimed by the retention sweeper, by policy",
+    ("policy",),
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (not raw path) to keep cardinality bounded
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
+        elif request.url.path.startswith("/assets/"):
+            path = "/assets"
+        else:
+            path = "unmatched"
+        HTTP_LATENCY.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=path,
+            status=str(status),
+        )
 
 
 @app.get("/healthz")
 def healthz():
-    worker_status = None
-    if WORKER_URL:
-        try:
-            with httpx.Client(timeout=5.0) as client:
-                r = client.get(f"{WORKER_URL}/healthz")
-                if r.status_code == 200 and r.json().get("worker") == "ok":
-                    worker_status = "ok"
-                else:
-                    worker_status = f"bad:{r.status_code}"
-        except Exception as e:
-            worker_status = f"error:{type(e).__name__}"
+    # Answered from the prober's cache; never blocks on a worker
+    # Public: summary only; per-worker URLs and errors are on /workers
     return {
         "ok": True,
         "storage": "s3" if _s3 else "local",
-        "worker": worker_status,
+        "worker": _worker_pool.status(),
+        "scheduler": _scheduler.snapshot(),
     }
 
 
+@app.get("/workers", dependencies=[Depends(verify_api_key)])
+def list_workers():
+    """Per-worker probe state (internal URLs, load, last error)."""
+    return {"workers": _worker_pool.snapshot()}
+
+
 # --- Storage setup (R2 / S3 or local fallback) ---
 USE_S3 = os.getenv("USE_S3", "false").lower() in ("1", "true", "yes")
 S3_BUCKET = os.getenv("S3_BUCKET")
@@ -111,22 +222,166 @@ S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
 S3_REGION = os.getenv("S3_REGION", "auto")
 WORKER_URL = os.getenv("WORKER_URL")
+# Comma-separated worker endpoints; WORKER_URL alone still works for one worker
+WORKER_URLS = [
+    u.strip() for u in (os.getenv("WORKER_URLS") or WORKER_URL or "").split(",")
+]
+WORKER_URLS = [u for u in WORKER_URLS if u]
+WORKER_PROBE_INTERVAL = float(os.getenv("WORKER_PROBE_INTERVAL", "5"))
+WORKER_PROBE_TIMEOUT = float(os.getenv("WORKER_PROBE_TIMEOUT", "2"))
+WORKER_UNHEALTHY_AFTER = int(os.getenv("WORKER_UNHEALTHY_AFTER", "2"))
+# Fair-share dispatch (see scheduler.py): jobs in flight overall, per shop, and for
+# the batch lane (admin test runs, backfills); weights as shop=weight,...
+# Overall cap: 0 follows the worker pool (sum of each worker's reported slots), a
+# positive value pins it
+DISPATCH_MAX_IN_FLIGHT = max(0, int(os.getenv("DISPATCH_MAX_IN_FLIGHT", "0")))
+# Cap for the dev simulator (no WORKER_URLS)
+SIMULATOR_MAX_IN_FLIGHT = 8
+# Threads that send jobs to workers; each only holds a request open briefly
+DISPATCH_THREADS = int(os.getenv("DISPATCH_THREADS", "8"))
+SHOP_MAX_IN_FLIGHT = int(os.getenv("SHOP_MAX_IN_FLIGHT", "2"))
+# Cap for jobs sent without a shop (0 = only the global/lane caps apply)
+DEFAULT_SHOP_MAX_IN_FLIGHT = int(os.getenv("DEFAULT_SHOP_MAX_IN_FLIGHT", "0"))
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "2"))
+SHOP_WEIGHTS = parse_weights(os.getenv("SHOP_WEIGHTS", ""))
+DISPATCH_LEASE_SECONDS = float(os.getenv("DISPATCH_LEASE_SECONDS", "900"))
+# No ready worker (warming up, all down): retry with backoff, fail after max wait
+DISPATCH_RETRY_BASE_SECONDS = float(os.getenv("DISPATCH_RETRY_BASE_SECONDS", "2"))
+DISPATCH_RETRY_MAX_SECONDS = float(os.getenv("DISPATCH_RETRY_MAX_SECONDS", "60"))
+DISPATCH_MAX_WAIT_SECONDS = float(os.getenv("DISPATCH_MAX_WAIT_SECONDS", "900"))
 MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "smplx_icon")
 BACKEND_INTERNAL_URL = os.getenv("BACKEND_INTERNAL_URL", "http://backend:8000")
 APP_CALLBACK_URL = os.getenv("APP_CALLBACK_URL")
 MODEL_CALLBACK_SECRET = os.getenv("MODEL_CALLBACK_SECRET")
+# App callback outbox delivery (see _outbox_loop)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_TIMEOUT_SECONDS", "10"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12"))
 DELETE_INPUTS_ON_SUCCESS = os.getenv("DELETE_INPUTS_ON_SUCCESS", "false").lower() in (
     "1",
     "true",
     "yes",
 )
 # Fail-safe completion delay (seconds). Set to 0 to disable.
-# Default: if WORKER_URL is set, disable fail-safe; else use 12s for dev simulator.
+# Default: if a worker is configured, disable fail-safe; else use 12s for dev simulator.
 JOB_FAILSAFE_SECONDS = int(
-    os.getenv("JOB_FAILSAFE_SECONDS", "0" if WORKER_URL else "12")
+    os.getenv("JOB_FAILSAFE_SECONDS", "0" if WORKER_URLS else "12")
 )
 STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(os.getcwd(), "data"))
 os.makedirs(STATIC_DIR, exist_ok=True)
+# Write .gz (and .br when the brotli module is installed) next to content-hashed
+# outputs in local storage so /assets can serve them precompressed.
+PRECOMPRESS_ASSETS = os.getenv("PRECOMPRESS_ASSETS", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Storage retention (see _sweep_storage). A value of 0 disables that policy.
+GC_INTERVAL_SECONDS = float(os.getenv("GC_INTERVAL_SECONDS", "3600"))
+GC_MAX_KEYS_PER_POLICY = int(os.getenv("GC_MAX_KEYS_PER_POLICY", "10000"))
+RETENTION_FAILED_INPUT_DAYS = float(os.getenv("RETENTION_FAILED_INPUT_DAYS", "7"))
+RETENTION_ORPHAN_UPLOAD_HOURS = float(os.getenv("RETENTION_ORPHAN_UPLOAD_HOURS", "24"))
+RETENTION_ORPHAN_OUTPUT_HOURS = float(os.getenv("RETENTION_ORPHAN_OUTPUT_HOURS", "24"))
+RETENTION_OUTPUT_DAYS = float(os.getenv("RETENTION_OUTPUT_DAYS", "0"))
+# Delivered app callbacks are only kept for debugging
+RETENTION_DELIVERED_CALLBACK_DAYS = float(
+    os.getenv("RETENTION_DELIVERED_CALLBACK_DAYS", "7")
+)
+
+_worker_pool = WorkerPool(
+    WORKER_URLS,
+    probe_interval=WORKER_PROBE_INTERVAL,
+    probe_timeout=WORKER_PROBE_TIMEOUT,
+    unhealthy_after=WORKER_UNHEALTHY_AFTER,
+)
+_scheduler = FairScheduler(
+    max_in_flight=DISPATCH_MAX_IN_FLIGHT or SIMULATOR_MAX_IN_FLIGHT,
+    capacity=None if DISPATCH_MAX_IN_FLIGHT else _worker_pool.capacity,
+    shop_max_in_flight=SHOP_MAX_IN_FLIGHT,
+    default_shop_max_in_flight=DEFAULT_SHOP_MAX_IN_FLIGHT,
+    batch_max_in_flight=BATCH_MAX_IN_FLIGHT,
+    weights=SHOP_WEIGHTS,
+    lease_seconds=DISPATCH_LEASE_SECONDS,
+)
+
+
+@app.on_event("startup")
+def _start_worker_prober():
+    _worker_pool.start()
+
+
+@app.on_event("shutdown")
+def _stop_worker_prober():
+    _worker_pool.stop()
+
+
+@app.on_event("startup")
+def _start_scheduler():
+    # Jobs still queued from a previous run go back into their lanes
+    with SessionLocal() as db:
+        queued = (
+            db.execute(
+                select(JobORM)
+                .where(JobORM.status == "queued")
+                .order_by(JobORM.created_at)
+            )
+            .scalars()
+            .all()
+        )
+    for job in queued:
+        _scheduler.submit(
+            job.id, job.shop, job.priority, (_job_input_keys(job), job.height_cm)
+        )
+    _scheduler.start(_enqueue_worker, concurrency=DISPATCH_THREADS)
+
+
+@app.on_event("shutdown")
+def _stop_scheduler():
+    _scheduler.stop()
+
+
+@app.on_event("startup")
+def _start_outbox_dispatcher():
+    global _outbox_thread
+    if _outbox_thread is None and APP_CALLBACK_URL and MODEL_CALLBACK_SECRET:
+        _outbox_stop.clear()
+        _outbox_thread = threading.Thread(
+            target=_outbox_loop, name="outbox-dispatcher", daemon=True
+        )
+        _outbox_thread.start()
+
+
+@app.on_event("startup")
+def _start_gc_sweeper():
+    global _gc_thread
+    if _gc_thread is None and GC_INTERVAL_SECONDS > 0:
+        _gc_stop.clear()
+        _gc_thread = threading.Thread(target=_gc_loop, name="storage-gc", daemon=True)
+        _gc_thread.start()
+
+
+@app.on_event("shutdown")
+def _stop_gc_sweeper():
+    global _gc_thread
+    _gc_stop.set()
+    if _gc_thread is not None:
+        _gc_thread.join(timeout=5.0)
+        _gc_thread = None
+
+
+@app.on_event("shutdown")
+def _stop_outbox_dispatcher():
+    global _outbox_thread
+    _outbox_stop.set()
+    _outbox_wakeup.set()
+    if _outbox_thread is not None:
+        _outbox_thread.join(timeout=OUTBOX_TIMEOUT_SECONDS + 1.0)
+        _outbox_thread = None
+
 
 _s3 = None
 if USE_S3 and S3_BUCKET and S3_ACCESS_KEY and S3_SECRET_KEY and S3_ENDPOINT:
@@ -144,20 +399,73 @@ def _make_key(*parts: str) -> str:
     return "/".join([p.strip("/") for p in parts])
 
 
+# Worker output keys (outputs/<job>.<16 hex sha256 prefix>.glb, see the worker's
+# output_key()) never change content once written. Only that exact shape counts:
+# user-named uploads can contain hex-looking segments too.
+_HASHED_KEY_RE = re.compile(r"^outputs/[^/]+\.[0-9a-f]{16}\.glb$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# (Content-Encoding, file suffix) in order of preference
+_PRECOMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _is_immutable_key(key: str) -> bool:
+    return bool(_HASHED_KEY_RE.search(key))
+
+
+def _cache_control_for(key: str) -> str:
+    if key.startswith("inputs/"):
+        # Customer photos: never cache
+        return "no-store"
+    if _is_immutable_key(key):
+        return IMMUTABLE_CACHE_CONTROL
+    # Mutable keys (placeholders, legacy outputs): cache but always revalidate
+    return "no-cache"
+
+
+def _write_precompressed(path: str, data: bytes) -> None:
+    """Write precompressed siblings of a local object (best effort)."""
+    try:
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    except Exception as e:
+        logger.warning("gzip precompression failed for %s: %s", path, e)
+    try:
+        import brotli  # optional
+    except ImportError:
+        return
+    try:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data))
+    except Exception as e:
+        logger.warning("brotli precompression failed for %s: %s", path, e)
+
+
 def put_object(key: str, data: bytes, content_type: str) -> str:
     if _s3:
         try:
-            _s3.put_object(
-                Bucket=S3_BUCKET, Key=key, Body=data, ContentType=content_type
-            )
+            extra = {}
+            if _is_immutable_key(key):
+                extra["CacheControl"] = IMMUTABLE_CACHE_CONTROL
+            with STORAGE_LATENCY.time(op="put", backend="s3"):
+                _s3.put_object(
+                    Bucket=S3_BUCKET,
+                    Key=key,
+                    Body=data,
+                    ContentType=content_type,
+                    **extra,
+                )
             return f"s3://{S3_BUCKET}/{key}"
         except Exception as e:
+            STORAGE_FALLBACKS.inc(op="put")
             logger.warning("S3 put_object failed, falling back to local storage: %s", e)
     # local fallback
     path = os.path.join(STATIC_DIR, key)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(data)
+    with STORAGE_LATENCY.time(op="put", backend="local"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        if PRECOMPRESS_ASSETS and _is_immutable_key(key):
+            _write_precompressed(path, data)
     return f"local://{path}"
 
 
@@ -167,34 +475,112 @@ def delete_object(key: str) -> None:
         return
     if _s3:
         try:
-            _s3.delete_object(Bucket=S3_BUCKET, Key=key)
+            with STORAGE_LATENCY.time(op="delete", backend="s3"):
+                _s3.delete_object(Bucket=S3_BUCKET, Key=key)
             return
         except Exception as e:
+            STORAGE_FALLBACKS.inc(op="delete")
             logger.warning(
                 "S3 delete_object failed, falling back to local delete: %s", e
             )
     # local fallback
     path = os.path.join(STATIC_DIR, key)
     try:
-        if os.path.exists(path):
-            os.remove(path)
+        with STORAGE_LATENCY.time(op="delete", backend="local"):
+            for p in [path] + [path + sfx for _, sfx in _PRECOMPRESSED_VARIANTS]:
+                if os.path.exists(p):
+                    os.remove(p)
     except Exception as e:
         logger.warning("Local delete failed for %s: %s", path, e)
 
 
+# S3 DeleteObjects accepts at most 1000 keys per request
+_DELETE_BATCH_SIZE = 1000
+
+
+def _local_delete(key: str) -> int:
+    """Remove a local object and its precompressed siblings; returns bytes freed."""
+    path = os.path.join(STATIC_DIR, key)
+    freed = 0
+    for p in [path] + [path + sfx for _, sfx in _PRECOMPRESSED_VARIANTS]:
+        try:
+            size = os.path.getsize(p)
+            os.remove(p)
+            freed += size
+        except FileNotFoundError:
+            continue
+    return freed
+
+
+def delete_objects(keys: list[str]) -> tuple[dict[str, Optional[int]], list[str]]:
+    """Bulk-delete keys from storage (S3/R2 or local).
+
+    Returns ({deleted key: bytes freed or None when the backend does not say},
+    [keys that failed]).
+    """
+    deleted: dict[str, Optional[int]] = {}
+    failed: list[str] = []
+    keys = [k for k in keys if k]
+    if _s3:
+        try:
+            for i in range(0, len(keys), _DELETE_BATCH_SIZE):
+                batch = keys[i : i + _DELETE_BATCH_SIZE]
+                with STORAGE_LATENCY.time(op="delete_batch", backend="s3"):
+                    resp = _s3.delete_objects(
+                        Bucket=S3_BUCKET,
+                        Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                    )
+                # Quiet mode only reports failures
+                errors = {e.get("Key") for e in resp.get("Errors", [])}
+                for k in batch:
+                    if k in errors:
+                        failed.append(k)
+                    else:
+                        deleted[k] = None
+            return deleted, failed
+        except Exception as e:
+            logger.warning("S3 delete_objects failed: %s", e)
+            # Only keys that put_object's local fallback wrote can be deleted
+            # here; the rest are still in S3 and must be retried
+            for k in keys:
+                if k in deleted or k in failed:
+                    continue
+                if os.path.exists(os.path.join(STATIC_DIR, k)):
+                    STORAGE_FALLBACKS.inc(op="delete_batch")
+                    try:
+                        deleted[k] = _local_delete(k)
+                        continue
+                    except Exception as le:
+                        logger.warning("Local delete failed for %s: %s", k, le)
+                failed.append(k)
+            return deleted, failed
+    with STORAGE_LATENCY.time(op="delete_batch", backend="local"):
+        for k in keys:
+            try:
+                deleted[k] = _local_delete(k)
+            except Exception as e:
+                logger.warning("Local delete failed for %s: %s", k, e)
+                failed.append(k)
+    return deleted, failed
+
+
 def presign_url(key: str, expires: int = 3600) -> Optional[str]:
     if _s3:
         try:
-            return _s3.generate_presigned_url(
-                ClientMethod="get_object",
-                Params={"Bucket": S3_BUCKET, "Key": key},
-                ExpiresIn=expires,
-            )
+            with STORAGE_LATENCY.time(op="get", backend="s3"):
+                return _s3.generate_presigned_url(
+                    ClientMethod="get_object",
+                    Params={"Bucket": S3_BUCKET, "Key": key},
+                    ExpiresIn=expires,
+                )
         except Exception as e:
+            STORAGE_FALLBACKS.inc(op="get")
             logger.warning("S3 presign failed, falling back to local assets: %s", e)
     # Local fallback: expose via a simple assets path
     path = os.path.join(STATIC_DIR, key)
-    if os.path.exists(path):
+    with STORAGE_LATENCY.time(op="get", backend="local"):
+        exists = os.path.exists(path)
+    if exists:
         # This is a dev-only URL; in prod, serve from a CDN or file server
         return f"/assets/{key}"
     return None
@@ -222,9 +608,26 @@ class JobORM(Base):
     status = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False)
     input_key = Column(String)
+    # All input views as a JSON list, front (= input_key) first; NULL on older rows
+    input_keys = Column(Text)
     output_key = Column(String)
     height_cm = Column(Float)
     error = Column(Text)
+    # Worker-reported per-stage timings (JSON {stage: ms}), their sum and the hot stage
+    stage_timings = Column(Text)
+    worker_ms = Column(Float)
+    slowest_stage = Column(String)
+    # Peak worker RSS while the job ran (only when the worker profiles memory)
+    peak_rss_mb = Column(Float)
+    # Lifecycle timestamps (UTC): dispatched to worker, worker started, finished
+    dispatched_at = Column(DateTime)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    provider_used = Column(String)
+    attempts = Column(Integer, default=0)
+    # Fair-share scheduling: owning shop domain and lane (interactive | batch)
+    shop = Column(String)
+    priority = Column(String)
 
 
 class AssetORM(Base):
@@ -232,12 +635,64 @@ class AssetORM(Base):
     object_key = Column(String, primary_key=True)
     kind = Column(String)  # photo | mesh
     created_at = Column(DateTime, nullable=False)
+    # Stored size when known (declared size for presigned uploads); used by GC reports
+    size_bytes = Column(Integer)
+
+
+class OutboxORM(Base):
+    """App callbacks written in the same transaction as the job update."""
+
+    __tablename__ = "callback_outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, nullable=False, index=True)
+    # Sent as Idempotency-Key; one event per job attempt and final status
+    idempotency_key = Column(String, nullable=False, unique=True)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, index=True)  # pending | delivered | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    delivered_at = Column(DateTime)
+    last_error = Column(Text)
 
 
 Base.metadata.create_all(engine)
 
 
+def _add_missing_columns() -> None:
+    """Add ORM columns missing from existing SQLite tables.
+
+    `create_all` never alters tables, so dev databases created before a column was
+    introduced would otherwise fail on the new attribute.
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {
+                row[1]
+                for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")
+            }
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = column.type.compile(dialect=engine.dialect)
+                logger.info("Adding column %s.%s", table.name, column.name)
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}"
+                )
+
+
+_add_missing_columns()
+
+
+def _job_input_keys(job: JobORM) -> list[str]:
+    """Input views of a job, front first."""
+    if job.input_keys:
+        return json.loads(job.input_keys)
+    return [job.input_key] if job.input_key else []
+
+
 def _simulate_worker(job_id: str):
+    started_at = datetime.now(timezone.utc)
     # Simulate processing delay
     time.sleep(2)
     # Mark as completed; real worker would write output to storage
@@ -247,18 +702,22 @@ def _simulate_worker(job_id: str):
             return
         job.status = "completed"
         job.output_key = _make_key("outputs", f"{job_id}.glb")
+        job.started_at = started_at
+        job.completed_at = datetime.now(timezone.utc)
+        job.provider_used = "simulator"
         db.add(job)
+        _add_app_callback(db, job)
         db.commit()
+    _outbox_wakeup.set()
     if not _s3:
         _ensure_placeholder_glb(job.output_key)
     # Best-effort cleanup of input on success
     if DELETE_INPUTS_ON_SUCCESS:
         try:
-            if job.input_key:
-                delete_object(job.input_key)
+            for key in _job_input_keys(job):
+                delete_object(key)
         except Exception:
             pass
-    _forward_app_callback(job_id, job.output_key)
 
 
 def _ensure_placeholder_glb(key: str):
@@ -303,29 +762,66 @@ def _ensure_placeholder_glb(key: str):
         pass
 
 
-def _enqueue_worker(job_id: str, input_key: str, height_cm: Optional[float]):
-    if not WORKER_URL:
+def _mark_dispatched(job_id: str) -> bool:
+    """Record a dispatch attempt on the job (timestamp + attempt counter).
+
+    Returns False if the job is gone or no longer queued (e.g. the fail-safe
+    finished it while it waited for a scheduler slot).
+    """
+    with SessionLocal() as db:
+        job = db.get(JobORM, job_id)
+        if not job or job.status != "queued":
+            return False
+        job.dispatched_at = datetime.now(timezone.utc)
+        job.attempts = (job.attempts or 0) + 1
+        db.add(job)
+        db.commit()
+    return True
+
+
+def _enqueue_worker(job_id: str, input_keys: list[str], height_cm: Optional[float]):
+    if not _mark_dispatched(job_id):
+        _scheduler.release(job_id)
+        return
+    if not _worker_pool.workers:
         logger.info("WORKER_URL not set; using simulator")
+        WORKER_DISPATCHES.inc(outcome="simulated")
         _simulate_worker(job_id)
+        _scheduler.release(job_id)
         return
-    # Build input URL accessible from the worker container
+    # Build input URLs accessible from the worker container
     if _s3:
-        input_url = presign_url(input_key)
+        input_urls = [presign_url(key) for key in input_keys]
     else:
-        input_url = f"{BACKEND_INTERNAL_URL}/assets/{input_key}"
+        input_urls = [f"{BACKEND_INTERNAL_URL}/assets/{key}" for key in input_keys]
     callback_url = f"{BACKEND_INTERNAL_URL}/jobs/{job_id}/callback"
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            client.post(
-                f"{WORKER_URL}/process",
-                json={
-                    "job_id": job_id,
-                    "input_url": input_url,
-                    "height_cm": height_cm,
-                    "callback_url": callback_url,
-                    "provider": MODEL_PROVIDER,
-                },
-            )
+    # Try the least-loaded healthy worker; on failure take it out of rotation and
+    # move on to the next one.
+    for _ in range(len(_worker_pool.workers)):
+        worker_url = _worker_pool.choose()
+        if worker_url is None:
+            break
+        try:
+            with httpx.Client(timeout=30.0) as client:
+                r = client.post(
+                    f"{worker_url}/process",
+                    json={
+                        "job_id": job_id,
+                        # input_url alone keeps single-view jobs readable by
+                        # workers that predate input_urls
+                        "input_url": input_urls[0],
+                        **({"input_urls": input_urls} if len(input_urls) > 1 else {}),
+                        "height_cm": height_cm,
+                        "callback_url": callback_url,
+                        "provider": MODEL_PROVIDER,
+                    },
+                )
+                r.raise_for_status()
+        except Exception as e:
+            WORKER_DISPATCHES.inc(outcome="error")
+            logger.warning("Failed to enqueue job %s on %s: %s", job_id, worker_url, e)
+            _worker_pool.mark_failed(worker_url, f"error:{type(e).__name__}")
+            continue
         # Mark as processing while worker runs
         with SessionLocal() as db:
             job = db.get(JobORM, job_id)
@@ -333,9 +829,46 @@ def _enqueue_worker(job_id: str, input_key: str, height_cm: Optional[float]):
                 job.status = "processing"
                 db.add(job)
                 db.commit()
-    except Exception as e:
-        logger.warning("Failed to enqueue worker; fallback to simulator: %s", e)
-        _simulate_worker(job_id)
+        WORKER_DISPATCHES.inc(outcome="ok")
+        return
+    _defer_dispatch(job_id, input_keys, height_cm)
+
+
+def _defer_dispatch(job_id: str, input_keys: list[str], height_cm: Optional[float]):
+    """No worker took the job: keep it queued and resubmit after a backoff, or fail
+    it once it has waited DISPATCH_MAX_WAIT_SECONDS."""
+    _scheduler.release(job_id)
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        job = db.get(JobORM, job_id)
+        if not job or job.status != "queued":
+            return
+        created = job.created_at
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        if (now - created).total_seconds() >= DISPATCH_MAX_WAIT_SECONDS:
+            logger.warning("No ready worker for job %s; giving up", job_id)
+            job.status = "failed"
+            job.error = "no worker available"
+            job.completed_at = now
+            db.add(job)
+            _add_app_callback(db, job)
+            db.commit()
+            _outbox_wakeup.set()
+            WORKER_DISPATCHES.inc(outcome="no_worker")
+            return
+        shop, priority, attempts = job.shop, job.priority, job.attempts or 1
+    delay = min(
+        DISPATCH_RETRY_MAX_SECONDS,
+        DISPATCH_RETRY_BASE_SECONDS * 2 ** min(attempts - 1, 10),
+    ) * random.uniform(0.5, 1.0)
+    logger.info("No ready worker for job %s; retrying in %.1fs", job_id, delay)
+    WORKER_DISPATCHES.inc(outcome="deferred")
+    timer = threading.Timer(
+        delay, _scheduler.submit, args=(job_id, shop, priority, (input_keys, height_cm))
+    )
+    timer.daemon = True
+    timer.start()
 
 
 def _fail_safe(job_id: str, delay_seconds: int = 12):
@@ -351,6 +884,7 @@ def _fail_safe(job_id: str, delay_seconds: int = 12):
         if job.status in {"queued", "processing"}:
             logger.warning("Fail-safe completing job %s due to timeout", job_id)
             job.status = "completed"
+            job.completed_at = datetime.now(timezone.utc)
             if not job.output_key:
                 job.output_key = _make_key("outputs", f"{job.id}.glb")
                 if not _s3:
@@ -359,15 +893,18 @@ def _fail_safe(job_id: str, delay_seconds: int = 12):
                         job.output_key, placeholder, content_type="model/gltf-binary"
                     )
             db.add(job)
+            _add_app_callback(db, job)
             db.commit()
+            _outbox_wakeup.set()
+            _scheduler.release(job_id)
 
 
-def _maybe_delete_input(input_key: Optional[str]):
-    """Delete input object if configured to do so."""
+def _maybe_delete_input(input_keys: list[str]):
+    """Delete input objects if configured to do so."""
     if not DELETE_INPUTS_ON_SUCCESS:
         return
-    if input_key:
-        delete_object(input_key)
+    for key in input_keys:
+        delete_object(key)
 
 
 # Height validation constants
@@ -392,6 +929,8 @@ async def create_upload(
     file: UploadFile = File(...),
     height_cm: Optional[float] = Form(default=None),
     customer_id: Optional[str] = Form(default=None),
+    shop: Optional[str] = Form(default=None),
+    priority: Literal["interactive", "batch"] = Form(default="interactive"),
 ):
     # Validate height
     try:
@@ -414,6 +953,7 @@ async def create_upload(
                 object_key=input_key,
                 kind="photo",
                 created_at=datetime.now(timezone.utc),
+                size_bytes=len(raw),
             )
         )
         db.add(
@@ -422,14 +962,16 @@ async def create_upload(
                 status="queued",
                 created_at=datetime.now(timezone.utc),
                 input_key=input_key,
+                input_keys=json.dumps([input_key]),
                 height_cm=height_cm,
+                shop=shop,
+                priority=priority,
             )
         )
         db.commit()
 
-    # Simulate processing (replace with call to worker service)
-    # Dispatch to worker if configured; else simulate
-    background_tasks.add_task(_enqueue_worker, job_id, input_key, height_cm)
+    # Dispatch to worker (or simulator) once the scheduler grants a slot
+    _scheduler.submit(job_id, shop, priority, ([input_key], height_cm))
     # Optional fail-safe (disabled by default when worker is configured)
     if JOB_FAILSAFE_SECONDS > 0:
         background_tasks.add_task(_fail_safe, job_id, JOB_FAILSAFE_SECONDS)
@@ -460,15 +1002,61 @@ def get_job(job_id: str):
     }
 
 
+def _parse_timestamp(value) -> Optional[datetime]:
+    """Parse an ISO-8601 timestamp from a callback payload as UTC (None if invalid)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def _is_number(value) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
 @app.post("/jobs/{job_id}/callback", dependencies=[Depends(verify_api_key)])
-def job_callback(job_id: str, payload: dict):
+def job_callback(job_id: str, payload: dict, background_tasks: BackgroundTasks):
     with SessionLocal() as db:
         job = db.get(JobORM, job_id)
         if not job:
             return JSONResponse({"error": "not_found"}, status_code=404)
         status = payload.get("status")
+        WORKER_CALLBACKS.inc(
+            status=status or "unknown",
+            provider=payload.get("provider_used") or "unknown",
+        )
         job.status = status or job.status
         job.error = payload.get("error")
+        if job.status in {"completed", "failed"}:
+            job.completed_at = datetime.now(timezone.utc)
+        started_at = _parse_timestamp(payload.get("started_at"))
+        if started_at:
+            job.started_at = started_at
+        if payload.get("provider_used"):
+            job.provider_used = payload["provider_used"]
+        # Malformed timing/memory fields are dropped rather than failing the callback
+        timings = payload.get("timings")
+        timings = {
+            str(k): float(v)
+            for k, v in (timings.items() if isinstance(timings, dict) else ())
+            if _is_number(v)
+        }
+        if timings:
+            job.stage_timings = json.dumps(timings)
+            job.worker_ms = float(sum(timings.values()))
+            job.slowest_stage = max(timings, key=timings.get)
+        memory = payload.get("memory")
+        if isinstance(memory, dict) and _is_number(memory.get("rss_peak_mb")):
+            job.peak_rss_mb = float(memory["rss_peak_mb"])
         output_key = payload.get("output_key")
         if output_key:
             job.output_key = output_key
@@ -481,38 +1069,477 @@ def job_callback(job_id: str, payload: dict):
                         created_at=datetime.now(timezone.utc),
                     )
                 )
+        if job.status == "completed" and not job.output_key:
+            job.output_key = _make_key("outputs", f"{job.id}.glb")
         db.add(job)
-        db.commit()
+        # Same transaction as the job update: the app notification cannot be lost
+        _add_app_callback(db, job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent duplicate of this callback committed first (same outbox
+            # idempotency key); it already applied the update and side effects
+            db.rollback()
+            logger.info("Duplicate callback for job %s ignored", job_id)
+            return {"ok": True, "duplicate": True}
+    _outbox_wakeup.set()
+    if job.status in {"completed", "failed"}:
+        _scheduler.release(job_id)
     if job.status == "completed":
-        if not job.output_key:
-            job.output_key = _make_key("outputs", f"{job.id}.glb")
+        # Storage side effects run after the response so the worker is not held up
         if not _s3:
-            _ensure_placeholder_glb(job.output_key)
-        # Best-effort cleanup of input on success
+            background_tasks.add_task(_ensure_placeholder_glb, job.output_key)
+        background_tasks.add_task(_safe_delete_input, _job_input_keys(job))
+    return {"ok": True}
+
+
+@app.post("/jobs/{job_id}/output", dependencies=[Depends(verify_api_key)])
+def job_output(job_id: str, payload: dict):
+    """Swap the mesh of a completed job (batch regeneration).
+
+    Only `output_key` and `provider_used` change: status, completion time, timings
+    and the (already deleted) inputs are left alone. The app is notified again.
+    """
+    output_key = payload.get("output_key")
+    if not isinstance(output_key, str) or not output_key:
+        return JSONResponse({"error": "output_key_required"}, status_code=400)
+    with SessionLocal() as db:
+        job = db.get(JobORM, job_id)
+        if not job:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        if job.status != "completed":
+            return JSONResponse({"error": "not_completed"}, status_code=409)
+        job.output_key = output_key
+        if payload.get("provider_used"):
+            job.provider_used = payload["provider_used"]
+        if not db.get(AssetORM, output_key):
+            db.add(
+                AssetORM(
+                    object_key=output_key,
+                    kind="mesh",
+                    created_at=datetime.now(timezone.utc),
+                )
+            )
+        db.add(job)
+        _add_app_callback(db, job, event=f"output:{output_key}")
         try:
-            _maybe_delete_input(job.input_key)
-        except Exception:
-            pass
-    _forward_app_callback(job_id, job.output_key)
+            db.commit()
+        except IntegrityError:
+            # Concurrent duplicate request for the same output committed first
+            db.rollback()
+            return {"ok": True, "duplicate": True}
+    _outbox_wakeup.set()
     return {"ok": True}
 
 
-def _forward_app_callback(job_id: str, output_key: Optional[str]):
+def _safe_delete_input(input_keys: list[str]):
+    # Best-effort cleanup of input on success
+    try:
+        _maybe_delete_input(input_keys)
+    except Exception:
+        pass
+
+
+# --- App callback outbox ---
+# Job updates insert an outbox row in the same transaction; a background thread
+# delivers due rows in batches with exponential backoff and an Idempotency-Key.
+_outbox_wakeup = threading.Event()
+_outbox_stop = threading.Event()
+_outbox_thread: Optional[threading.Thread] = None
+
+
+def _add_app_callback(db, job: JobORM, event: Optional[str] = None) -> None:
+    """Stage an app callback for `job` in the caller's session (no commit).
+
+    `event` distinguishes further notifications for the same attempt and status
+    (e.g. a replaced output).
+    """
     if not APP_CALLBACK_URL or not MODEL_CALLBACK_SECRET:
         return
+    key = f"{job.id}:{job.attempts or 0}:{job.status}"
+    if event:
+        key += f":{event}"
+    if db.execute(select(OutboxORM.id).where(OutboxORM.idempotency_key == key)).first():
+        return  # duplicate worker callback for the same attempt
+    now = datetime.now(timezone.utc)
+    payload = {"job_id": job.id, "status": job.status, "output_key": job.output_key}
+    if job.error:
+        payload["error"] = job.error
+    db.add(
+        OutboxORM(
+            job_id=job.id,
+            idempotency_key=key,
+            payload=json.dumps(payload),
+            status="pending",
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
+        )
+    )
+
+
+def _outbox_backoff(attempts: int) -> float:
+    delay = OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1))
+    # Full jitter in [delay/2, delay] avoids synchronized retries after an outage
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, delay) * random.uniform(0.5, 1.0)
+
+
+def _deliver_app_callback(
+    client: httpx.Client, key: str, payload: str
+) -> tuple[str, Optional[str]]:
+    """POST one outbox entry; returns (ok | retry | dead, error)."""
     try:
-        with httpx.Client(timeout=20.0) as client:
-            client.post(
-                f"{APP_CALLBACK_URL.rstrip('/')}/internal/model-run-callback",
-                json={
-                    "job_id": job_id,
-                    "status": "completed",
-                    "output_key": output_key,
-                },
-                headers={"X-Callback-Secret": MODEL_CALLBACK_SECRET},
+        r = client.post(
+            f"{APP_CALLBACK_URL.rstrip('/')}/internal/model-run-callback",
+            content=payload,
+            headers={
+                "Content-Type": "application/json",
+                "X-Callback-Secret": MODEL_CALLBACK_SECRET,
+                "Idempotency-Key": key,
+            },
+        )
+    except Exception as e:
+        return "retry", f"{type(e).__name__}: {e}"
+    if r.is_success:
+        return "ok", None
+    # The app rejected the event itself (e.g. unknown job): retrying cannot help
+    if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+        return "dead", f"http {r.status_code}"
+    return "retry", f"http {r.status_code}"
+
+
+def _dispatch_outbox_batch(client: httpx.Client, executor: ThreadPoolExecutor) -> int:
+    """Claim and deliver up to OUTBOX_BATCH_SIZE due entries; returns how many."""
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        rows = (
+            db.execute(
+                select(OutboxORM)
+                .where(OutboxORM.status == "pending")
+                .where(OutboxORM.next_attempt_at <= now)
+                .order_by(OutboxORM.id)
+                .limit(OUTBOX_BATCH_SIZE)
+            )
+            .scalars()
+            .all()
+        )
+        if not rows:
+            return 0
+        # Lease the batch so another backend process does not pick it up meanwhile
+        lease_until = now + timedelta(seconds=OUTBOX_TIMEOUT_SECONDS * 2)
+        for row in rows:
+            row.next_attempt_at = lease_until
+        db.commit()
+        entries = [(row.id, row.idempotency_key, row.payload) for row in rows]
+
+    results = list(
+        executor.map(lambda e: _deliver_app_callback(client, e[1], e[2]), entries)
+    )
+
+    done = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        for (entry_id, key, _), (outcome, error) in zip(entries, results):
+            row = db.get(OutboxORM, entry_id)
+            if row is None:
+                continue
+            row.attempts += 1
+            row.last_error = error
+            if outcome == "ok":
+                row.status = "delivered"
+                row.delivered_at = done
+            elif outcome == "dead" or row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                outcome = "dead"
+                row.status = "dead"
+                logger.warning("App callback %s dropped: %s", key, error)
+            else:
+                row.next_attempt_at = done + timedelta(
+                    seconds=_outbox_backoff(row.attempts)
+                )
+            APP_CALLBACKS.inc(outcome=outcome)
+        db.commit()
+    return len(entries)
+
+
+def _outbox_loop() -> None:
+    with (
+        httpx.Client(timeout=OUTBOX_TIMEOUT_SECONDS) as client,
+        ThreadPoolExecutor(max_workers=OUTBOX_CONCURRENCY) as executor,
+    ):
+        while not _outbox_stop.is_set():
+            try:
+                sent = _dispatch_outbox_batch(client, executor)
+            except Exception as e:
+                logger.warning("Outbox dispatch failed: %s", e)
+                sent = 0
+            if sent >= OUTBOX_BATCH_SIZE:
+                continue  # more entries are probably due
+            _outbox_wakeup.wait(OUTBOX_POLL_SECONDS)
+            _outbox_wakeup.clear()
+
+
+# --- Storage retention sweeper ---
+# Each policy selects expired keys from the assets/jobs tables; the objects are
+# bulk-deleted and their asset rows dropped so they are not selected again.
+_gc_stop = threading.Event()
+_gc_thread: Optional[threading.Thread] = None
+_gc_lock = threading.Lock()
+
+# One row per (job, input view); rows from before input_keys fall back to input_key
+_JOB_INPUTS = """
+    WITH job_inputs AS (
+      SELECT j.status, j.created_at, j.completed_at, k.value AS object_key
+      FROM jobs j, json_each(COALESCE(j.input_keys, json_array(j.input_key))) k
+    )
+"""
+
+_GC_POLICIES = (
+    # (name, retention setting, retention unit in seconds, SQL selecting object keys)
+    (
+        "failed_inputs",
+        lambda: RETENTION_FAILED_INPUT_DAYS,
+        86400,
+        _JOB_INPUTS
+        + """
+        SELECT DISTINCT a.object_key, a.size_bytes FROM assets a
+        JOIN job_inputs j ON j.object_key = a.object_key
+        WHERE a.kind = 'photo' AND j.status = 'failed'
+          AND julianday(COALESCE(j.completed_at, j.created_at)) < julianday(:cutoff)
+          AND NOT EXISTS (
+            SELECT 1 FROM job_inputs o
+            WHERE o.object_key = a.object_key AND o.status != 'failed'
+          )
+        """,
+    ),
+    (
+        "orphan_uploads",
+        lambda: RETENTION_ORPHAN_UPLOAD_HOURS,
+        3600,
+        _JOB_INPUTS
+        + """
+        SELECT a.object_key, a.size_bytes FROM assets a
+        WHERE a.kind = 'photo' AND julianday(a.created_at) < julianday(:cutoff)
+          AND NOT EXISTS (SELECT 1 FROM job_inputs j WHERE j.object_key = a.object_key)
+        """,
+    ),
+    (
+        "orphan_outputs",
+        lambda: RETENTION_ORPHAN_OUTPUT_HOURS,
+        3600,
+        """
+        SELECT a.object_key, a.size_bytes FROM assets a
+        WHERE a.kind = 'mesh' AND julianday(a.created_at) < julianday(:cutoff)
+          AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.output_key = a.object_key)
+        """,
+    ),
+    (
+        "expired_outputs",
+        lambda: RETENTION_OUTPUT_DAYS,
+        86400,
+        """
+        SELECT a.object_key, a.size_bytes FROM assets a
+        WHERE a.kind = 'mesh' AND julianday(a.created_at) < julianday(:cutoff)
+        """,
+    ),
+)
+
+
+def _sweep_storage(dry_run: bool = False) -> dict:
+    """Apply every enabled retention policy once and report what was reclaimed."""
+    start = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    report = {"dry_run": dry_run, "policies": {}, "objects": 0, "bytes": 0, "errors": 0}
+    with _gc_lock:
+        for name, retention, unit, sql in _GC_POLICIES:
+            if retention() <= 0:
+                continue
+            cutoff = now - timedelta(seconds=retention() * unit)
+            with SessionLocal() as db:
+                rows = db.execute(
+                    text(sql + " LIMIT :limit"),
+                    {
+                        "cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                        "limit": GC_MAX_KEYS_PER_POLICY,
+                    },
+                ).all()
+            sizes = {key: size for key, size in rows}
+            if dry_run:
+                deleted = {k: None for k in sizes}
+                failed: list[str] = []
+            else:
+                deleted, failed = delete_objects(list(sizes))
+                if deleted:
+                    with SessionLocal() as db:
+                        db.execute(
+                            AssetORM.__table__.delete().where(
+                                AssetORM.object_key.in_(list(deleted))
+                            )
+                        )
+                        db.commit()
+            freed = sum(
+                b if b is not None else (sizes.get(k) or 0) for k, b in deleted.items()
             )
+            report["policies"][name] = {
+                "objects": len(deleted),
+                "bytes": freed,
+                "errors": len(failed),
+            }
+            report["objects"] += len(deleted)
+            report["bytes"] += freed
+            report["errors"] += len(failed)
+            if not dry_run:
+                GC_OBJECTS.inc(len(deleted), policy=name)
+                GC_BYTES.inc(freed, policy=name)
+        if RETENTION_DELIVERED_CALLBACK_DAYS > 0:
+            report["callbacks_pruned"] = _prune_outbox(
+                now - timedelta(days=RETENTION_DELIVERED_CALLBACK_DAYS), dry_run
+            )
+    report["duration_s"] = round(time.perf_counter() - start, 3)
+    if report["objects"] or report["errors"] or report.get("callbacks_pruned"):
+        logger.info("Storage sweep: %s", json.dumps(report))
+    return report
+
+
+def _prune_outbox(cutoff: datetime, dry_run: bool = False) -> int:
+    """Drop delivered app callbacks older than `cutoff`; returns the row count."""
+    where = (OutboxORM.status == "delivered") & (OutboxORM.delivered_at < cutoff)
+    with SessionLocal() as db:
+        if dry_run:
+            return db.scalar(select(func.count()).select_from(OutboxORM).where(where))
+        n = db.execute(OutboxORM.__table__.delete().where(where)).rowcount
+        db.commit()
+    return n
+
+
+def _gc_loop() -> None:
+    while not _gc_stop.wait(GC_INTERVAL_SECONDS):
+        try:
+            _sweep_storage()
+        except Exception as e:
+            logger.warning("Storage sweep failed: %s", e)
+
+
+@app.post("/gc/sweep", dependencies=[Depends(verify_api_key)])
+def gc_sweep(dry_run: bool = False):
+    """Run the retention sweeper now (dry_run lists counts without deleting)."""
+    return _sweep_storage(dry_run=dry_run)
+
+
+def _refresh_job_gauges() -> None:
+    """Recompute job status gauges from the jobs table (called at scrape time)."""
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(JobORM.status, func.count()).group_by(JobORM.status)
+        ).all()
+    counts = {status: n for status, n in rows}
+    JOBS_BY_STATUS.replace({(status,): n for status, n in counts.items()})
+    QUEUE_DEPTH.set(counts.get("queued", 0))
+    with SessionLocal() as db:
+        pending = db.execute(
+            select(func.count())
+            .select_from(OutboxORM)
+            .where(OutboxORM.status == "pending")
+        ).scalar_one()
+    OUTBOX_PENDING.set(pending)
+    SCHEDULED_JOBS.replace(
+        {
+            (lane, state): lane_stats[state]
+            for lane, lane_stats in _scheduler.snapshot().items()
+            for state in ("queued", "in_flight")
+        }
+    )
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    try:
+        _refresh_job_gauges()
     except Exception as e:
-        logger.warning("Failed to forward app callback: %s", e)
+        logger.warning("Failed to refresh job gauges: %s", e)
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Nearest-rank percentiles per (provider, status, metric) using window functions.
+# Timestamps are stored by SQLAlchemy as "YYYY-MM-DD HH:MM:SS.ffffff" UTC strings.
+_LATENCY_STATS_SQL = text(
+    """
+    WITH lat AS (
+        SELECT
+            COALESCE(provider_used, 'unknown') AS provider,
+            status,
+            (julianday(started_at) - julianday(created_at)) * 86400.0 AS queue_wait,
+            (julianday(completed_at) - julianday(started_at)) * 86400.0 AS processing,
+            (julianday(completed_at) - julianday(created_at)) * 86400.0 AS end_to_end
+        FROM jobs
+        WHERE julianday(created_at) >= julianday(:since)
+          AND completed_at IS NOT NULL
+    ),
+    vals AS (
+        SELECT provider, status, 'queue_wait' AS metric, queue_wait AS v
+        FROM lat WHERE queue_wait IS NOT NULL
+        UNION ALL
+        SELECT provider, status, 'processing', processing
+        FROM lat WHERE processing IS NOT NULL
+        UNION ALL
+        SELECT provider, status, 'end_to_end', end_to_end
+        FROM lat WHERE end_to_end IS NOT NULL
+    ),
+    ranked AS (
+        SELECT
+            provider, status, metric, v,
+            ROW_NUMBER() OVER (
+                PARTITION BY provider, status, metric ORDER BY v
+            ) AS rn,
+            COUNT(*) OVER (PARTITION BY provider, status, metric) AS n
+        FROM vals
+    )
+    SELECT
+        provider,
+        status,
+        metric,
+        MAX(n) AS count,
+        AVG(v) AS mean,
+        MIN(CASE WHEN rn >= 0.50 * n THEN v END) AS p50,
+        MIN(CASE WHEN rn >= 0.95 * n THEN v END) AS p95,
+        MIN(CASE WHEN rn >= 0.99 * n THEN v END) AS p99
+    FROM ranked
+    GROUP BY provider, status, metric
+    ORDER BY provider, status, metric
+    """
+)
+
+
+@app.get("/stats", dependencies=[Depends(verify_api_key)])
+def latency_stats(window_hours: float = 24.0):
+    """Latency percentiles (seconds) per provider and status over a recent window.
+
+    Metrics: queue_wait (created -> worker started), processing (started -> finished)
+    and end_to_end (created -> finished). Only finished jobs are included.
+    """
+    if window_hours <= 0:
+        return JSONResponse({"error": "window_hours must be positive"}, status_code=400)
+    since = datetime.now(timezone.utc) - timedelta(hours=window_hours)
+    with SessionLocal() as db:
+        rows = db.execute(
+            _LATENCY_STATS_SQL, {"since": since.strftime("%Y-%m-%d %H:%M:%S.%f")}
+        ).mappings()
+        stats = [
+            {
+                "provider": r["provider"],
+                "status": r["status"],
+                "metric": r["metric"],
+                "count": r["count"],
+                "mean": round(r["mean"], 3),
+                "p50": round(r["p50"], 3),
+                "p95": round(r["p95"], 3),
+                "p99": round(r["p99"], 3),
+            }
+            for r in rows
+        ]
+    return {
+        "window_hours": window_hours,
+        "since": since.isoformat(),
+        "stats": stats,
+    }
 
 
 class PresignRequest(BaseModel):
@@ -522,9 +1549,19 @@ class PresignRequest(BaseModel):
 @app.post("/presign", dependencies=[Depends(verify_api_key)])
 def presign(req: PresignRequest):
     uploads = []
+    assets = []
     for f in req.files:
         name = f.get("name") or "file"
         key = _make_key("inputs", f"{uuid.uuid4()}_{name}")
+        # Track the key up front so uploads that are never enqueued can be swept
+        assets.append(
+            AssetORM(
+                object_key=key,
+                kind="photo",
+                created_at=datetime.now(timezone.utc),
+                size_bytes=int(f.get("size") or 0) or None,
+            )
+        )
         if _s3 and USE_S3:
             try:
                 post = _s3.generate_presigned_post(
@@ -558,6 +1595,9 @@ def presign(req: PresignRequest):
                 "fields": {"key": key},
             }
         )
+    with SessionLocal() as db:
+        db.add_all(assets)
+        db.commit()
     return {"uploads": uploads}
 
 
@@ -567,21 +1607,35 @@ async def dev_upload(file: UploadFile = File(...), key: str = Form(...)):
     put_object(key, raw, content_type=file.content_type or "application/octet-stream")
     try:
         with SessionLocal() as db:
-            db.add(
-                AssetORM(
-                    object_key=key, kind="photo", created_at=datetime.now(timezone.utc)
+            asset = db.get(AssetORM, key)
+            if asset is None:
+                # Workers upload their results through here too
+                kind = "mesh" if key.startswith("outputs/") else "photo"
+                asset = AssetORM(
+                    object_key=key, kind=kind, created_at=datetime.now(timezone.utc)
                 )
-            )
+            asset.size_bytes = len(raw)
+            db.add(asset)
             db.commit()
     except Exception:
         pass
     return {"ok": True, "object_key": key}
 
 
+# Input views per job: front, then optionally side
+MAX_INPUT_VIEWS = 2
+
+
 class EnqueueRequest(BaseModel):
     job_id: str
-    input_key: str
+    # Single view: input_key. Several views: input_keys, front first.
+    input_key: Optional[str] = None
+    input_keys: list[str] = []
     height_cm: Optional[float] = None
+    # Shop domain the job is billed to; interactive = storefront, batch = admin/backfill
+    shop: Optional[str] = None
+    # None keeps a re-enqueued job's lane; new jobs default to interactive
+    priority: Optional[Literal["interactive", "batch"]] = None
 
     @field_validator("height_cm")
     @classmethod
@@ -592,6 +1646,17 @@ class EnqueueRequest(BaseModel):
             )
         return v
 
+    @model_validator(mode="after")
+    def normalize_inputs(self):
+        if not self.input_keys:
+            if not self.input_key:
+                raise ValueError("input_key or input_keys is required")
+            self.input_keys = [self.input_key]
+        if len(self.input_keys) > MAX_INPUT_VIEWS:
+            raise ValueError(f"at most {MAX_INPUT_VIEWS} input_keys are supported")
+        self.input_key = self.input_keys[0]
+        return self
+
 
 @app.post("/enqueue", dependencies=[Depends(verify_api_key)])
 def enqueue_job(req: EnqueueRequest, background_tasks: BackgroundTasks):
@@ -602,15 +1667,24 @@ def enqueue_job(req: EnqueueRequest, background_tasks: BackgroundTasks):
         if job:
             # Update mutable fields if provided
             changed = False
-            if req.input_key and job.input_key != req.input_key:
+            if _job_input_keys(job) != req.input_keys:
                 job.input_key = req.input_key
+                job.input_keys = json.dumps(req.input_keys)
                 changed = True
             if req.height_cm is not None and job.height_cm != req.height_cm:
                 job.height_cm = req.height_cm
                 changed = True
+            if req.shop and job.shop != req.shop:
+                job.shop = req.shop
+                changed = True
+            if req.priority and job.priority != req.priority:
+                job.priority = req.priority
+                changed = True
             # Decide whether to (re)dispatch
             if job.status in {"failed"}:
                 job.status = "queued"
+                job.started_at = None
+                job.completed_at = None
                 changed = True
                 dispatch = True
             elif job.status in {"queued"}:
@@ -629,23 +1703,91 @@ def enqueue_job(req: EnqueueRequest, background_tasks: BackgroundTasks):
                 status="queued",
                 created_at=datetime.now(timezone.utc),
                 input_key=req.input_key,
+                input_keys=json.dumps(req.input_keys),
                 height_cm=req.height_cm,
+                shop=req.shop,
+                priority=req.priority or "interactive",
             )
             db.add(job)
             db.commit()
             dispatch = True
     if dispatch:
-        background_tasks.add_task(
-            _enqueue_worker, req.job_id, req.input_key, req.height_cm
+        _scheduler.submit(
+            req.job_id, job.shop, job.priority, (_job_input_keys(job), job.height_cm)
         )
         if JOB_FAILSAFE_SECONDS > 0:
             background_tasks.add_task(_fail_safe, req.job_id, JOB_FAILSAFE_SECONDS)
     return {"job_id": req.job_id, "status": job.status}
 
 
-# Dev-only static file serving for local storage
-from fastapi.staticfiles import StaticFiles
+# --- Asset serving for local storage ---
+# Only object prefixes are exposed (never the SQLite database in STATIC_DIR).
+_ASSET_PREFIXES = ("inputs/", "outputs/")
+mimetypes.add_type("model/gltf-binary", ".glb")
+
+
+@lru_cache(maxsize=4096)
+def _file_etag(path: str, mtime_ns: int, size: int) -> str:
+    """Strong ETag from the file's SHA-256 (cached per path/mtime/size)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return f'"{h.hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in candidates
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> set[str]:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
 
-assets_root = os.path.join(STATIC_DIR)
-os.makedirs(assets_root, exist_ok=True)
-app.mount("/assets", StaticFiles(directory=assets_root), name="assets")
+@app.api_route("/assets/{key:path}", methods=["GET", "HEAD"])
+def get_asset(key: str, request: Request):
+    """Serve a locally stored object with ETag, conditional GET and Range support.
+
+    Content-hashed keys are served `immutable`; precompressed `.br`/`.gz` siblings
+    are preferred when the client accepts them.
+    """
+    root = os.path.realpath(STATIC_DIR)
+    path = os.path.realpath(os.path.join(root, key))
+    if not key.startswith(_ASSET_PREFIXES) or not path.startswith(root + os.sep):
+        return JSONResponse({"error": "not_found"}, status_code=404)
+    if not os.path.isfile(path):
+        return JSONResponse({"error": "not_found"}, status_code=404)
+
+    headers = {"Cache-Control": _cache_control_for(key), "Vary": "Accept-Encoding"}
+    accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding, suffix in _PRECOMPRESSED_VARIANTS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            path = path + suffix
+            headers["Content-Encoding"] = encoding
+            break
+
+    stat = os.stat(path)
+    etag = _file_etag(path, stat.st_mtime_ns, stat.st_size)
+    headers["ETag"] = etag
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    # FileResponse handles Range / If-Range (206, 416) and HEAD
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,239 @@
+"""Per-shop fair-share job scheduling.
+
+Jobs wait here until the backend has dispatch capacity instead of being pushed to
+the workers in arrival order. Overall capacity comes from a callable (the worker
+pool's total slots), so it grows and shrinks with the fleet. Two lanes are served in strict priority order:
+`interactive` (storefront try-ons) before `batch` (admin test runs, backfills), and
+the batch lane may only hold a bounded share of the in-flight slots so interactive
+jobs always find room. Within a lane, shops are picked by start-time fair queuing:
+each shop has a virtual time that advances by 1/weight per dispatched job, the shop
+with the smallest virtual time goes next, and a shop that becomes active starts at
+the lane's current virtual time so it cannot claim credit for time it was idle.
+Each shop is also capped in how many of its jobs may be in flight at once. Jobs
+without a shop (scripts, internal callers) share `_default`, which has its own cap
+and is uncapped by default so unscoped callers are not throttled to one shop's share.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+logger = logging.getLogger("rapso-backend")
+
+LANES = ("interactive", "batch")
+DEFAULT_SHOP = "_default"
+
+
+@dataclass
+class QueuedJob:
+    job_id: str
+    shop: str
+    lane: str
+    args: tuple = ()
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _ShopQueue:
+    jobs: deque = field(default_factory=deque)
+    vtime: float = 0.0
+    in_flight: int = 0
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parse `shop-a.myshopify.com=3,shop-b.myshopify.com=0.5` into weights."""
+    weights = {}
+    for item in (spec or "").split(","):
+        shop, _, value = item.partition("=")
+        if shop.strip() and value.strip():
+            try:
+                weights[shop.strip()] = max(0.01, float(value))
+            except ValueError:
+                logger.warning("Ignoring bad shop weight %r", item)
+    return weights
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        shop_max_in_flight: int = 2,
+        batch_max_in_flight: int = 2,
+        weights: Optional[dict[str, float]] = None,
+        lease_seconds: float = 900.0,
+        default_shop_max_in_flight: int = 0,
+        capacity: Optional[Callable[[], int]] = None,
+    ):
+        # Global cap: `capacity()` when given and positive, else `max_in_flight`
+        self.max_in_flight = max(1, max_in_flight)
+        self.capacity = capacity
+        self.shop_max_in_flight = max(1, shop_max_in_flight)
+        # 0: `_default` is only bounded by the lane and global caps
+        self.default_shop_max_in_flight = max(0, default_shop_max_in_flight)
+        self.batch_max_in_flight = max(1, batch_max_in_flight)
+        self.weights = weights or {}
+        self.lease_seconds = lease_seconds
+        self._shops: dict[str, dict[str, _ShopQueue]] = {lane: {} for lane in LANES}
+        self._vclock = {lane: 0.0 for lane in LANES}
+        self._lane_in_flight = {lane: 0 for lane in LANES}
+        # job_id -> (job, lease deadline); jobs currently dispatched
+        self._in_flight: dict[str, tuple[QueuedJob, float]] = {}
+        self._queued_ids: set[str] = set()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Queue operations ---
+
+    def submit(
+        self, job_id: str, shop: Optional[str], lane: str, args: tuple = ()
+    ) -> bool:
+        """Queue a job; returns False if it is already queued or in flight."""
+        shop = shop or DEFAULT_SHOP
+        lane = lane if lane in LANES else LANES[0]
+        with self._cond:
+            if job_id in self._queued_ids or job_id in self._in_flight:
+                return False
+            q = self._shops[lane].setdefault(shop, _ShopQueue())
+            if not q.jobs:
+                # Newly active: no credit for the time spent idle
+                q.vtime = max(q.vtime, self._vclock[lane])
+            q.jobs.append(QueuedJob(job_id=job_id, shop=shop, lane=lane, args=args))
+            self._queued_ids.add(job_id)
+            self._cond.notify()
+        return True
+
+    def global_cap(self) -> int:
+        if self.capacity is not None:
+            try:
+                cap = self.capacity()
+            except Exception as e:
+                logger.warning("Capacity lookup failed: %s", e)
+                cap = 0
+            if cap > 0:
+                return cap
+        return self.max_in_flight
+
+    def _shop_cap(self, shop: str, cap: int) -> int:
+        if shop == DEFAULT_SHOP:
+            return self.default_shop_max_in_flight or cap
+        return self.shop_max_in_flight
+
+    def _lane_cap(self, lane: str, cap: int) -> int:
+        if lane == "batch":
+            return min(self.batch_max_in_flight, cap)
+        return cap
+
+    def _next_locked(self) -> Optional[QueuedJob]:
+        cap = self.global_cap()
+        if len(self._in_flight) >= cap:
+            return None
+        for lane in LANES:
+            if self._lane_in_flight[lane] >= self._lane_cap(lane, cap):
+                continue
+            eligible = [
+                (q.vtime, shop, q)
+                for shop, q in self._shops[lane].items()
+                if q.jobs and q.in_flight < self._shop_cap(shop, cap)
+            ]
+            if not eligible:
+                continue
+            vtime, shop, q = min(eligible, key=lambda e: (e[0], e[1]))
+            job = q.jobs.popleft()
+            q.vtime = vtime + 1.0 / self.weights.get(shop, 1.0)
+            q.in_flight += 1
+            self._vclock[lane] = vtime
+            self._lane_in_flight[lane] += 1
+            self._queued_ids.discard(job.job_id)
+            self._in_flight[job.job_id] = (job, time.monotonic() + self.lease_seconds)
+            return job
+        return None
+
+    def next(self) -> Optional[QueuedJob]:
+        """Pop the next job allowed to run (marking it in flight), or None."""
+        with self._cond:
+            return self._next_locked()
+
+    def release(self, job_id: str) -> None:
+        """Free a job's in-flight slot once it finished (or failed to dispatch)."""
+        with self._cond:
+            entry = self._in_flight.pop(job_id, None)
+            if entry is None:
+                return
+            job = entry[0]
+            self._lane_in_flight[job.lane] -= 1
+            q = self._shops[job.lane].get(job.shop)
+            if q is not None:
+                q.in_flight -= 1
+                if not q.jobs and q.in_flight == 0:
+                    self._shops[job.lane].pop(job.shop, None)
+            self._cond.notify()
+
+    def _expire_leases(self) -> None:
+        # Backstop for jobs whose callback never arrives
+        now = time.monotonic()
+        with self._cond:
+            expired = [
+                jid for jid, (_, deadline) in self._in_flight.items() if deadline < now
+            ]
+            for job_id in expired:
+                logger.warning("Job %s held a dispatch slot past its lease", job_id)
+                self.release(job_id)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                lane: {
+                    "queued": sum(len(q.jobs) for q in self._shops[lane].values()),
+                    "in_flight": self._lane_in_flight[lane],
+                    "shops": len(self._shops[lane]),
+                }
+                for lane in LANES
+            }
+
+    # --- Dispatch loop ---
+
+    def start(self, dispatch: Callable[..., None], concurrency: int) -> None:
+        """Run `dispatch(job_id, *args)` for jobs as capacity allows."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(dispatch, concurrency),
+            name="scheduler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def _run(self, dispatch: Callable[..., None], concurrency: int) -> None:
+        def run(job: QueuedJob) -> None:
+            try:
+                dispatch(job.job_id, *job.args)
+            except Exception as e:
+                logger.warning("Dispatch of job %s failed: %s", job.job_id, e)
+                self.release(job.job_id)
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="dispatch"
+        ) as executor:
+            while not self._stop.is_set():
+                self._expire_leases()
+                with self._cond:
+                    job = self._next_locked()
+                    if job is None:
+                        self._cond.wait(timeout=1.0)
+                        continue
+                executor.submit(run, job)
@@ -0,0 +1,178 @@
+"""Worker endpoint pool with background health/capacity probing.
+
+A daemon thread polls each worker's `/healthz` and caches whether it is healthy and
+how loaded it is (`queue_depth`, `free_slots`). Dispatch picks the least-loaded
+healthy worker from that cache, so neither dispatch nor the backend's `/healthz`
+ever waits on a worker.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("rapso-backend")
+
+
+@dataclass
+class WorkerState:
+    url: str
+    # Optimistic until the first probe so jobs can flow right after startup
+    healthy: bool = True
+    ready: bool = True
+    queue_depth: int = 0
+    free_slots: int = 0
+    # Jobs the worker runs at once (WORKER_SLOTS)
+    slots: int = 1
+    # Jobs we sent since the last probe (not yet reflected in queue_depth)
+    pending: int = 0
+    consecutive_failures: int = 0
+    last_probe: Optional[float] = None
+    last_error: Optional[str] = None
+
+    def load(self) -> int:
+        return self.queue_depth + self.pending - self.free_slots
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ready": self.ready,
+            "queue_depth": self.queue_depth,
+            "free_slots": self.free_slots,
+            "slots": self.slots,
+            "pending": self.pending,
+            "last_probe_age_s": (
+                round(time.monotonic() - self.last_probe, 1)
+                if self.last_probe is not None
+                else None
+            ),
+            "last_error": self.last_error,
+        }
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        urls: list[str],
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+        unhealthy_after: int = 2,
+    ):
+        self.workers = [WorkerState(url=u.rstrip("/")) for u in urls]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.unhealthy_after = unhealthy_after
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.workers)
+
+    # --- Probing ---
+
+    def start(self) -> None:
+        if not self.workers or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="worker-prober", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.probe_timeout + 1.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        with httpx.Client(timeout=self.probe_timeout) as client:
+            while not self._stop.is_set():
+                self.probe_once(client)
+                self._stop.wait(self.probe_interval)
+
+    def probe_once(self, client: httpx.Client) -> None:
+        for w in self.workers:
+            try:
+                r = client.get(f"{w.url}/healthz")
+                body = r.json() if r.status_code == 200 else {}
+                ok = body.get("worker") == "ok"
+                error = None if ok else f"bad:{r.status_code}"
+            except Exception as e:
+                body, ok, error = {}, False, f"error:{type(e).__name__}"
+            self._record_probe(w, ok, body, error)
+
+    def _record_probe(
+        self, w: WorkerState, ok: bool, body: dict, error: Optional[str]
+    ) -> None:
+        with self._lock:
+            w.last_probe = time.monotonic()
+            w.last_error = error
+            if ok:
+                if not w.healthy:
+                    logger.info("Worker %s back in rotation", w.url)
+                w.healthy = True
+                w.consecutive_failures = 0
+                # Workers that predate capacity reporting count as one free slot
+                w.ready = bool(body.get("ready", True))
+                w.queue_depth = int(body.get("queue_depth") or 0)
+                w.free_slots = int(body.get("free_slots", 1) or 0)
+                w.slots = max(1, int(body.get("slots") or 1))
+                w.pending = 0
+            else:
+                w.consecutive_failures += 1
+                if w.healthy and w.consecutive_failures >= self.unhealthy_after:
+                    logger.warning("Worker %s out of rotation (%s)", w.url, error)
+                    w.healthy = False
+
+    # --- Routing ---
+
+    def choose(self) -> Optional[str]:
+        """Return the least-loaded healthy, ready worker URL (None if none)."""
+        with self._lock:
+            candidates = [w for w in self.workers if w.healthy and w.ready]
+            if not candidates:
+                return None
+            best = min(candidates, key=WorkerState.load)
+            best.pending += 1
+            return best.url
+
+    def mark_failed(self, url: str, error: str) -> None:
+        """Take a worker out of rotation after a failed dispatch until it probes ok."""
+        with self._lock:
+            for w in self.workers:
+                if w.url == url:
+                    w.pending = max(0, w.pending - 1)
+                    w.consecutive_failures = self.unhealthy_after
+                    w.last_error = error
+                    if w.healthy:
+                        logger.warning("Worker %s out of rotation (%s)", url, error)
+                    w.healthy = False
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [w.as_dict() for w in self.workers]
+
+    def capacity(self) -> int:
+        """Jobs the pool can run at once: the sum of every worker's reported slots.
+
+        Workers out of rotation still count, so jobs keep reaching dispatch (and its
+        retry/fail path) instead of waiting in the scheduler indefinitely.
+        """
+        with self._lock:
+            return sum(w.slots for w in self.workers)
+
+    def status(self) -> Optional[str]:
+        """Summary for /healthz: ok | degraded | unavailable (None if no workers)."""
+        if not self.workers:
+            return None
+        with self._lock:
+            healthy = sum(1 for w in self.workers if w.healthy and w.ready)
+        if healthy == len(self.workers):
+            return "ok"
+        return "degraded" if healthy else "unavailable"
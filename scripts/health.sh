@@ -24,6 +24,7 @@ fi
 if [ -n "${worker:-}" ]; then
   case "$worker" in
     ok) exit 0 ;;
+    degraded) echo "Worker pool degraded (some workers out of rotation)" >&2; exit 0 ;;
     *) echo "Worker not healthy: $worker" >&2; exit 3 ;;
   esac
 fi
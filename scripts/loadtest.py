@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""End-to-end load test for the backend with a fake worker and local storage.
+
+Starts the backend (uvicorn) against a temporary STATIC_DIR/SQLite database and a
+stand-in worker with configurable latency and failure rate, then drives the real
+client flows at a fixed concurrency:
+
+  presign flow: POST /presign -> POST /dev/upload -> POST /enqueue -> poll GET /jobs/{id}
+  upload flow:  POST /uploads -> poll GET /jobs/{id}
+
+The fake worker uploads a tiny GLB through /dev/upload and posts the job callback,
+so callbacks are load-tested too. Jobs are spread across `--shops` fake shop domains
+so the per-shop in-flight cap of the fair scheduler does not become the bottleneck
+being measured. Reports requests/s, tail latency and error rate per
+endpoint, job completion latency and SQLite lock contention.
+
+Run from `backend/` so the backend's dependencies are available:
+    uv run python ../scripts/loadtest.py --concurrency 32 --duration 60
+    uv run python ../scripts/loadtest.py --backend-url http://localhost:8000  # existing backend
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+
+# Smallest valid GLB header + empty JSON chunk; enough for the asset path
+_FAKE_GLB = (
+    b"glTF\x02\x00\x00\x00\x24\x00\x00\x00"
+    b"\x0c\x00\x00\x00JSON"
+    b'{"asset":{}}'
+    b"\x20\x20\x20\x20"
+)
+_LOCK_MARKERS = ("database is locked", "database table is locked")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_vals: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_vals:
+        return 0.0
+    rank = max(1, math.ceil(p * len(sorted_vals)))
+    return sorted_vals[rank - 1]
+
+
+class Stats:
+    """Per-endpoint latency samples and status code counts (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.codes: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, seconds: float, code: str) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.codes[endpoint][code] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        out = {}
+        with self._lock:
+            for endpoint, vals in sorted(self.latencies.items()):
+                vals = sorted(vals)
+                codes = dict(self.codes[endpoint])
+                errors = sum(n for c, n in codes.items() if not c.startswith("2"))
+                out[endpoint] = {
+                    "count": len(vals),
+                    "rps": round(len(vals) / elapsed, 2) if elapsed else 0.0,
+                    "error_rate": round(errors / len(vals), 4) if vals else 0.0,
+                    "p50_ms": round(_percentile(vals, 0.50) * 1000, 1),
+                    "p95_ms": round(_percentile(vals, 0.95) * 1000, 1),
+                    "p99_ms": round(_percentile(vals, 0.99) * 1000, 1),
+                    "max_ms": round(vals[-1] * 1000, 1) if vals else 0.0,
+                    "codes": codes,
+                }
+        return out
+
+
+# --- Fake worker ---
+
+
+def start_fake_worker(
+    latency: float,
+    jitter: float,
+    failure_rate: float,
+    stats: Stats,
+    api_key: str | None = None,
+    slots: int = 8,
+):
+    """Serve /healthz and /process like worker/main.py, without doing any CPU work.
+
+    `slots` is reported on /healthz; the backend sizes its dispatch cap from it.
+    """
+    running = [0]
+    running_lock = threading.Lock()
+    # Upload and callback are API-key protected when the backend has a key
+    headers = {"X-API-Key": api_key} if api_key else {}
+
+    def run_job(job: dict) -> None:
+        try:
+            _run_job(job)
+        finally:
+            with running_lock:
+                running[0] -= 1
+
+    def _run_job(job: dict) -> None:
+        time.sleep(max(0.0, random.gauss(latency, jitter)))
+        callback_url = job.get("callback_url")
+        if not callback_url:
+            return
+        base = callback_url.split("/jobs/")[0]
+        out_key = f"outputs/{job['job_id']}.glb"
+        failed = random.random() < failure_rate
+        with httpx.Client(timeout=60.0) as client:
+            if not failed:
+                start = time.perf_counter()
+                try:
+                    r = client.post(
+                        f"{base}/dev/upload",
+                        files={"file": ("out.glb", _FAKE_GLB, "model/gltf-binary")},
+                        data={"key": out_key},
+                        headers=headers,
+                    )
+                    code = str(r.status_code)
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                stats.record("worker:/dev/upload", time.perf_counter() - start, code)
+            payload = (
+                {
+                    "status": "failed",
+                    "error": "injected failure",
+                    "provider_used": "fake",
+                }
+                if failed
+                else {
+                    "status": "completed",
+                    "output_key": out_key,
+                    "provider_used": "fake",
+                }
+            )
+            start = time.perf_counter()
+            try:
+                r = client.post(callback_url, json=payload, headers=headers)
+                code = str(r.status_code)
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            stats.record("worker:callback", time.perf_counter() - start, code)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, code: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                with running_lock:
+                    free = max(0, slots - running[0])
+                self._json(
+                    200,
+                    {"worker": "ok", "ready": True, "slots": slots, "free_slots": free},
+                )
+            else:
+                self._json(404, {"error": "not_found"})
+
+        def do_POST(self):
+            if self.path != "/process":
+                self._json(404, {"error": "not_found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            job = json.loads(self.rfile.read(length) or b"{}")
+            with running_lock:
+                running[0] += 1
+            threading.Thread(target=run_job, args=(job,), daemon=True).start()
+            self._json(
+                200, {"ok": True, "job_id": job.get("job_id"), "status": "processing"}
+            )
+
+        def log_message(self, *args):
+            pass
+
+    port = _free_port()
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+# --- Backend process ---
+
+
+def start_backend(worker_url: str, static_dir: str, log_path: str, api_key: str | None):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(
+        {
+            "WORKER_URL": worker_url,
+            "BACKEND_INTERNAL_URL": f"http://127.0.0.1:{port}",
+            "STATIC_DIR": static_dir,
+            "USE_S3": "false",
+            "JOB_FAILSAFE_SECONDS": "0",
+            "APP_CALLBACK_URL": "",
+        }
+    )
+    env.pop("SQLITE_PATH", None)
+    if api_key:
+        env["BACKEND_API_KEY"] = api_key
+    else:
+        env.pop("BACKEND_API_KEY", None)
+    log = open(log_path, "w")
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited early; see {log_path}")
+        try:
+            if httpx.get(f"{url}/healthz", timeout=1.0).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"backend did not become healthy; see {log_path}")
+
+
+def count_lock_errors(log_path: str) -> int:
+    try:
+        with open(log_path, errors="replace") as f:
+            return sum(1 for line in f if any(m in line for m in _LOCK_MARKERS))
+    except OSError:
+        return 0
+
+
+# --- Load generator ---
+
+
+class Load:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, args):
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.image = os.urandom(args.image_bytes)
+        self.job_latencies: list[float] = []
+        self.job_outcomes: dict[str, int] = defaultdict(int)
+
+    async def _call(self, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, **kwargs)
+            code = str(r.status_code)
+        except httpx.HTTPError as e:
+            r = None
+            code = type(e).__name__
+        self.stats.record(endpoint, time.perf_counter() - start, code)
+        return r
+
+    def _shop(self) -> str:
+        return f"loadtest-{random.randrange(self.args.shops)}.myshopify.com"
+
+    async def presign_flow(self) -> str | None:
+        r = await self._call(
+            "/presign",
+            "POST",
+            "/presign",
+            json={
+                "files": [
+                    {
+                        "name": "photo.jpg",
+                        "contentType": "image/jpeg",
+                        "size": len(self.image),
+                    }
+                ]
+            },
+        )
+        if r is None or r.status_code != 200:
+            return None
+        upload = r.json()["uploads"][0]
+        key = upload["object_key"]
+        r = await self._call(
+            "/dev/upload",
+            "POST",
+            "/dev/upload",
+            files={"file": ("photo.jpg", self.image, "image/jpeg")},
+            data={"key": key},
+        )
+        if r is None or r.status_code != 200:
+            return None
+        job_id = os.urandom(16).hex()
+        r = await self._call(
+            "/enqueue",
+            "POST",
+            "/enqueue",
+            json={
+                "job_id": job_id,
+                "input_key": key,
+                "height_cm": 170,
+                "shop": self._shop(),
+            },
+        )
+        if r is None or r.status_code != 200:
+            return None
+        return job_id
+
+    async def upload_flow(self) -> str | None:
+        r = await self._call(
+            "/uploads",
+            "POST",
+            "/uploads",
+            files={"file": ("photo.jpg", self.image, "image/jpeg")},
+            data={"height_cm": "170", "shop": self._shop()},
+        )
+        if r is None or r.status_code != 200:
+            return None
+        return r.json().get("job_id")
+
+    async def poll(self, job_id: str, started: float) -> None:
+        deadline = started + self.args.job_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            r = await self._call("/jobs/{job_id}", "GET", f"/jobs/{job_id}")
+            if r is None or r.status_code != 200:
+                continue
+            status = r.json().get("status")
+            if status in {"completed", "failed"}:
+                self.job_outcomes[status] += 1
+                if status == "completed":
+                    self.job_latencies.append(time.perf_counter() - started)
+                return
+        self.job_outcomes["timeout"] += 1
+
+    async def user(self, stop_at: float) -> None:
+        while time.perf_counter() < stop_at:
+            if (
+                self.args.max_jobs
+                and sum(self.job_outcomes.values()) >= self.args.max_jobs
+            ):
+                return
+            started = time.perf_counter()
+            if random.random() < self.args.uploads_ratio:
+                job_id = await self.upload_flow()
+            else:
+                job_id = await self.presign_flow()
+            if job_id is None:
+                self.job_outcomes["submit_error"] += 1
+                continue
+            await self.poll(job_id, started)
+
+
+async def drive(base_url: str, stats: Stats, args) -> tuple[Load, float]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=args.request_timeout, limits=limits, headers=headers
+    ) as client:
+        load = Load(client, stats, args)
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        await asyncio.gather(*(load.user(stop_at) for _ in range(args.concurrency)))
+        return load, time.perf_counter() - start
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"\nDuration {report['elapsed_s']}s, concurrency {report['concurrency']}, total {report['total_rps']} req/s"
+    )
+    print(
+        f"{'endpoint':<22} {'count':>7} {'req/s':>8} {'err%':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    )
+    for endpoint, s in report["endpoints"].items():
+        print(
+            f"{endpoint:<22} {s['count']:>7} {s['rps']:>8} {s['error_rate'] * 100:>6.2f}%"
+            f" {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}"
+        )
+    jobs = report["jobs"]
+    print(
+        f"\nJobs: {jobs['outcomes']}  completion p50 {jobs['p50_s']}s"
+        f" p95 {jobs['p95_s']}s p99 {jobs['p99_s']}s"
+    )
+    if report["sqlite_lock_errors"] is not None:
+        print(f"SQLite lock errors in backend log: {report['sqlite_lock_errors']}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument(
+        "--concurrency", type=int, default=16, help="concurrent simulated clients"
+    )
+    ap.add_argument(
+        "--duration", type=float, default=30.0, help="seconds to generate load"
+    )
+    ap.add_argument(
+        "--max-jobs",
+        type=int,
+        default=0,
+        help="stop after N finished jobs (0 = no cap)",
+    )
+    ap.add_argument(
+        "--uploads-ratio",
+        type=float,
+        default=0.2,
+        help="share of jobs using POST /uploads",
+    )
+    ap.add_argument(
+        "--shops",
+        type=int,
+        default=16,
+        help="spread jobs over N shop domains (scheduler caps in-flight per shop)",
+    )
+    ap.add_argument("--image-bytes", type=int, default=200_000)
+    ap.add_argument("--poll-interval", type=float, default=0.5)
+    ap.add_argument("--job-timeout", type=float, default=60.0)
+    ap.add_argument("--request-timeout", type=float, default=30.0)
+    ap.add_argument(
+        "--worker-latency",
+        type=float,
+        default=1.0,
+        help="fake worker mean seconds per job",
+    )
+    ap.add_argument("--worker-jitter", type=float, default=0.2)
+    ap.add_argument("--worker-failure-rate", type=float, default=0.05)
+    ap.add_argument(
+        "--worker-slots",
+        type=int,
+        default=8,
+        help="slots the fake worker reports (backend dispatch cap)",
+    )
+    ap.add_argument(
+        "--backend-url", help="target an already running backend (no fake worker)"
+    )
+    ap.add_argument("--api-key", default=os.getenv("BACKEND_API_KEY"))
+    ap.add_argument("--output", help="write the JSON report here")
+    args = ap.parse_args(argv)
+
+    stats = Stats()
+    proc = server = None
+    log_path = None
+    load, elapsed = None, 0.0
+    with tempfile.TemporaryDirectory(prefix="rapso-loadtest-") as td:
+        try:
+            if args.backend_url:
+                base_url = args.backend_url.rstrip("/")
+            else:
+                server, worker_url = start_fake_worker(
+                    args.worker_latency,
+                    args.worker_jitter,
+                    args.worker_failure_rate,
+                    stats,
+                    args.api_key,
+                    args.worker_slots,
+                )
+                log_path = os.path.join(td, "backend.log")
+                proc, base_url = start_backend(worker_url, td, log_path, args.api_key)
+                print(f"backend {base_url} (log {log_path}), fake worker {worker_url}")
+            load, elapsed = asyncio.run(drive(base_url, stats, args))
+            # Let in-flight fake jobs call back before reading the lock counter
+            time.sleep(min(5.0, args.worker_latency * 2))
+        except Exception as e:
+            print(f"load test failed: {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            if server is not None:
+                server.shutdown()
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+        if load is None:
+            return 1
+
+        endpoints = stats.summary(elapsed)
+        client_requests = sum(
+            s["count"] for e, s in endpoints.items() if not e.startswith("worker:")
+        )
+        job_lat = sorted(load.job_latencies)
+        report = {
+            "elapsed_s": round(elapsed, 2),
+            "concurrency": args.concurrency,
+            "total_rps": round(client_requests / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+            "jobs": {
+                "outcomes": dict(load.job_outcomes),
+                "p50_s": round(_percentile(job_lat, 0.50), 2),
+                "p95_s": round(_percentile(job_lat, 0.95), 2),
+                "p99_s": round(_percentile(job_lat, 0.99), 2),
+            },
+            "sqlite_lock_errors": count_lock_errors(log_path) if log_path else None,
+        }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""Offline batch mesh generation with the same provider code as `/process`.
+
+Reads a JSONL manifest (one `{"job_id", "input", "height_cm"?, "provider"?}` per
+line; `input` is a local path or http(s) URL, or a list of them for front + side
+views) or a directory of images (job id = file stem), runs the providers in a
+process pool and stores each GLB under a content-hashed `outputs/` key, either
+through the backend's storage layer (`--backend-url`, i.e. `/dev/upload` -> S3/R2
+or local) or into a local directory laid out like backend storage
+(`--output-dir`). Finished items are appended to a checkpoint file so an
+interrupted run resumes where it stopped.
+
+Usage (from `worker/`):
+    uv run python batch.py --input-dir photos/ --output-dir out/
+    uv run python batch.py --manifest jobs.jsonl --backend-url http://localhost:8000 \\
+        --update-jobs --processes 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Optional
+
+import httpx
+from pipeline import load_providers, output_key, run_provider, upload_output
+from providers import MAX_INPUT_VIEWS
+from providers.timing import StageTimer
+
+logger = logging.getLogger("rapso-worker")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Per-process state set by _init_process
+_opts: dict = {}
+_client: Optional[httpx.Client] = None
+
+
+def load_items(manifest: Optional[str], input_dir: Optional[str]) -> list[dict]:
+    items = []
+    if manifest:
+        with open(manifest) as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if not item.get("job_id") or not item.get("input"):
+                    raise ValueError(f"{manifest}:{n}: job_id and input are required")
+                items.append(item)
+    if input_dir:
+        for name in sorted(os.listdir(input_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append(
+                    {
+                        "job_id": os.path.splitext(name)[0],
+                        "input": os.path.join(input_dir, name),
+                    }
+                )
+    return items
+
+
+def load_checkpoint(path: str) -> dict[str, dict]:
+    """Last recorded result per job id (later lines win)."""
+    done: dict[str, dict] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            done[entry["job_id"]] = entry
+    return done
+
+
+def _init_process(opts: dict) -> None:
+    global _opts, _client
+    _opts = opts
+    _client = httpx.Client(timeout=600.0)
+    # Import providers once per process, not per item
+    load_providers()
+
+
+def _store(key: str, glb_bytes: bytes) -> None:
+    if _opts["backend_url"]:
+        upload_output(_client, _opts["backend_url"], key, glb_bytes, _opts["api_key"])
+        return
+    path = os.path.join(_opts["output_dir"], key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(glb_bytes)
+    os.replace(tmp, path)
+
+
+def process_item(item: dict) -> dict:
+    """Generate and store one mesh; never raises (errors go into the result)."""
+    timer = StageTimer()
+    started = time.perf_counter()
+    result = {"job_id": item["job_id"], "status": "failed"}
+    provider = item.get("provider") or _opts["provider"]
+    try:
+        with tempfile.TemporaryDirectory() as td:
+            sources = item["input"]
+            if isinstance(sources, str):
+                sources = [sources]
+            if len(sources) > MAX_INPUT_VIEWS:
+                raise ValueError(f"at most {MAX_INPUT_VIEWS} input views are supported")
+            in_paths = []
+            for n, src in enumerate(sources):
+                in_path = src
+                if src.startswith(("http://", "https://")):
+                    in_path = os.path.join(td, f"input_{n}.jpg")
+                    with timer.stage("download"):
+                        r = _client.get(src)
+                        r.raise_for_status()
+                        with open(in_path, "wb") as f:
+                            f.write(r.content)
+                in_paths.append(in_path)
+            out_path = os.path.join(td, "output.glb")
+            result["provider_used"] = run_provider(
+                in_paths, out_path, provider, item.get("height_cm"), timer
+            )
+            with open(out_path, "rb") as f:
+                glb_bytes = f.read()
+            key = output_key(item["job_id"], glb_bytes)
+            with timer.stage("upload"):
+                _store(key, glb_bytes)
+        if _opts["update_jobs"]:
+            with timer.stage("callback"):
+                _update_job(item["job_id"], key, result["provider_used"], timer)
+        result.update(status="ok", output_key=key, bytes=len(glb_bytes))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+    result["stages_ms"] = timer.as_ms()
+    return result
+
+
+def _update_job(job_id: str, key: str, provider_used: str, timer: StageTimer):
+    """Point a backend job at its regenerated output.
+
+    Completed jobs only get their output swapped; jobs that never completed are
+    completed with the full callback, like an online run.
+    """
+    base = _opts["backend_url"].rstrip("/")
+    headers = {"X-API-Key": _opts["api_key"]} if _opts["api_key"] else None
+    r = _client.post(
+        f"{base}/jobs/{job_id}/output",
+        json={"output_key": key, "provider_used": provider_used},
+        headers=headers,
+    )
+    if r.status_code == 409:
+        r = _client.post(
+            f"{base}/jobs/{job_id}/callback",
+            json={
+                "status": "completed",
+                "output_key": key,
+                "provider_used": provider_used,
+                "timings": timer.as_ms(),
+            },
+            headers=headers,
+        )
+    r.raise_for_status()
+
+
+def _summary(results: list[dict], wall: float, skipped: int) -> dict:
+    ok = [r for r in results if r["status"] == "ok"]
+    latencies = sorted(r["ms"] for r in results)
+    stage_totals: dict[str, float] = {}
+    for r in results:
+        for stage, ms in r.get("stages_ms", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+    return {
+        "processed": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "skipped": skipped,
+        "wall_s": round(wall, 2),
+        "items_per_s": round(len(results) / wall, 3) if wall > 0 else None,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": (
+            round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1)
+            if latencies
+            else None
+        ),
+        "output_mb": round(sum(r.get("bytes", 0) for r in ok) / 1e6, 2),
+        "stage_share": {
+            k: round(v / max(1e-9, sum(stage_totals.values())), 3)
+            for k, v in stage_totals.items()
+        },
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    src = ap.add_argument_group("inputs (at least one)")
+    src.add_argument("--manifest", help="JSONL with job_id, input, height_cm, provider")
+    src.add_argument("--input-dir", help="directory of images; job id = file stem")
+    dst = ap.add_mutually_exclusive_group(required=True)
+    dst.add_argument("--backend-url", help="store outputs via the backend /dev/upload")
+    dst.add_argument("--output-dir", help="store outputs under DIR/outputs/")
+    ap.add_argument(
+        "--provider",
+        default=os.getenv("MODEL_PROVIDER", "silhouette"),
+        help="default provider",
+    )
+    ap.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    ap.add_argument(
+        "--checkpoint", help="default: batch_checkpoint.jsonl next to outputs"
+    )
+    ap.add_argument("--retry-failed", action="store_true", help="rerun failed items")
+    ap.add_argument(
+        "--update-jobs",
+        action="store_true",
+        help="point each backend job at its new output (needs --backend-url)",
+    )
+    ap.add_argument("--limit", type=int, help="process at most N pending items")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if not args.manifest and not args.input_dir:
+        ap.error("one of --manifest or --input-dir is required")
+    if args.update_jobs and not args.backend_url:
+        ap.error("--update-jobs needs --backend-url")
+    checkpoint = args.checkpoint or os.path.join(
+        args.output_dir or ".", "batch_checkpoint.jsonl"
+    )
+
+    items = load_items(args.manifest, args.input_dir)
+    done = load_checkpoint(checkpoint)
+    finished = {"ok"} if args.retry_failed else {"ok", "failed"}
+    pending = [
+        i for i in items if done.get(i["job_id"], {}).get("status") not in finished
+    ]
+    skipped = len(items) - len(pending)
+    if args.limit is not None:
+        pending = pending[: args.limit]
+    print(f"{len(items)} items, {skipped} already done, {len(pending)} to process")
+    if not pending:
+        return 0
+
+    opts = {
+        "backend_url": args.backend_url,
+        "output_dir": args.output_dir,
+        "api_key": os.getenv("BACKEND_API_KEY"),
+        "provider": args.provider,
+        "update_jobs": args.update_jobs,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint)), exist_ok=True)
+    results = []
+    start = time.perf_counter()
+    # spawn: providers (MediaPipe, TripoSR) are not fork-safe once initialised
+    with (
+        ProcessPoolExecutor(
+            max_workers=max(1, args.processes),
+            mp_context=get_context("spawn"),
+            initializer=_init_process,
+            initargs=(opts,),
+        ) as pool,
+        open(checkpoint, "a") as ckpt,
+    ):
+        futures = [pool.submit(process_item, item) for item in pending]
+        for n, fut in enumerate(as_completed(futures), 1):
+            result = fut.result()
+            results.append(result)
+            ckpt.write(json.dumps(result) + "\n")
+            ckpt.flush()
+            if result["status"] != "ok":
+                print(f"  {result['job_id']}: {result.get('error')}", file=sys.stderr)
+            if n % 25 == 0 or n == len(pending):
+                elapsed = time.perf_counter() - start
+                rate = n / elapsed if elapsed > 0 else 0.0
+                eta = (len(pending) - n) / rate if rate else 0.0
+                print(f"{n}/{len(pending)}  {rate:.2f} items/s  eta {eta:.0f}s")
+
+    summary = _summary(results, time.perf_counter() - start, skipped)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
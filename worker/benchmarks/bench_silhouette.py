@@ -0,0 +1,298 @@
+"""Offline benchmarks for the silhouette provider hot path.
+
+Times `_profile_from_mask`, `_revolve_profile` and GLB export (direct writer and
+trimesh) separately on synthetic body silhouettes across mask resolutions and
+slice/segment counts (uniform and adaptive ring placement), plus segmentation
+with the configured backend when it is installed. Reports median latency,
+throughput and peak traced memory, and compares against a stored baseline.
+
+Usage (from `worker/`):
+    uv run python benchmarks/bench_silhouette.py                  # run + compare
+    uv run python benchmarks/bench_silhouette.py --save-baseline  # record baseline
+    uv run python benchmarks/bench_silhouette.py --quick --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import trimesh
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+
+from providers import segmentation  # noqa: E402
+from providers import silhouette_revolve as sr  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+# Portrait phone photos: (name, height, width)
+RESOLUTIONS = [
+    ("720p", 1280, 720),
+    ("1080p", 1920, 1080),
+    ("1440p", 2560, 1440),
+    ("4k", 3840, 2160),
+]
+SLICE_COUNTS = [48, 96, 192]
+SEGMENT_COUNTS = [24, 48, 96]
+
+
+def synthetic_mask(h: int, w: int) -> np.ndarray:
+    """Deterministic front-view body silhouette (uint8 0/255) sized h x w.
+
+    Half-width per row follows a head / neck / shoulders / waist / hips / legs
+    outline so the profile has both flat stretches and fast changes.
+    """
+    t = np.linspace(0.0, 1.0, h, dtype=np.float32)  # 0 = top of frame
+    # Control points (t, half-width as a fraction of image width)
+    knots_t = np.array(
+        [
+            0.0,
+            0.06,
+            0.10,
+            0.16,
+            0.18,
+            0.22,
+            0.30,
+            0.42,
+            0.52,
+            0.58,
+            0.75,
+            0.92,
+            0.94,
+            1.0,
+        ]
+    )
+    knots_w = np.array(
+        [0.0, 0.0, 0.07, 0.06, 0.04, 0.19, 0.17, 0.13, 0.16, 0.15, 0.10, 0.06, 0.0, 0.0]
+    )
+    half = np.interp(t, knots_t, knots_w) * w
+    cx = w / 2.0
+    xs = np.arange(w, dtype=np.float32)
+    mask = np.abs(xs[None, :] - cx) <= half[:, None]
+    return mask.astype(np.uint8) * 255
+
+
+def _time(fn, repeat: int) -> list[float]:
+    out = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def _peak_bytes(fn) -> int:
+    """Peak Python/NumPy heap growth during one call (traced separately from timing)."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - base)
+
+
+def _record(results: dict, name: str, fn, repeat: int, units: float, unit_name: str):
+    fn()  # warm-up (imports, caches)
+    samples = _time(fn, repeat)
+    median = statistics.median(samples)
+    results[name] = {
+        "median_ms": round(median * 1000.0, 3),
+        "min_ms": round(min(samples) * 1000.0, 3),
+        "throughput": round(units / median, 2) if median > 0 else None,
+        "throughput_unit": unit_name,
+        "peak_mem_mb": round(_peak_bytes(fn) / 1e6, 3),
+    }
+    print(
+        f"{name:<48} {results[name]['median_ms']:>10.2f} ms"
+        f"  {results[name]['throughput']:>12} {unit_name}"
+        f"  {results[name]['peak_mem_mb']:>8.2f} MB"
+    )
+
+
+def _have_mediapipe() -> bool:
+    try:
+        import mediapipe  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def run(
+    resolutions, slice_counts, segment_counts, repeat: int, mediapipe: bool
+) -> dict:
+    results: dict = {}
+    for res_name, h, w in resolutions:
+        mask = synthetic_mask(h, w)
+        mpx = (h * w) / 1e6
+
+        if mediapipe:
+            rgb = np.repeat(mask[:, :, None], 3, axis=2)
+            _record(
+                results,
+                f"segment/{res_name}",
+                lambda: sr._segment_raw(rgb),
+                repeat,
+                mpx,
+                "Mpx/s",
+            )
+        _record(
+            results,
+            f"morphology/{res_name}",
+            lambda: sr._clean_mask(mask > 0),
+            repeat,
+            mpx,
+            "Mpx/s",
+        )
+
+        # None = adaptive ring placement (the production default)
+        for slices in list(slice_counts) + [None]:
+            slice_tag = "adaptive" if slices is None else f"s{slices}"
+            _record(
+                results,
+                f"profile/{res_name}/{slice_tag}",
+                lambda: sr._profile_from_mask(mask, num_slices=slices),
+                repeat,
+                mpx,
+                "Mpx/s",
+            )
+            profile = sr._profile_from_mask(mask, num_slices=slices)
+            for segments in segment_counts:
+                tag = f"{res_name}/{slice_tag}/r{segments}"
+                n_tris = 2 * (len(profile[0]) - 1) * segments
+
+                def build(profile=profile, segments=segments):
+                    ys_norm, half_widths_px, _ = profile
+                    verts, faces = sr._revolve_profile(
+                        ys_norm, half_widths_px, 170.0, segments
+                    )
+                    return verts, faces, sr.vertex_normals(verts, faces)
+
+                _record(results, f"mesh/{tag}", build, repeat, n_tris, "tris/s")
+                arrays = build()
+                _record(
+                    results,
+                    f"glb_export/{tag}",
+                    lambda arrays=arrays: sr.encode_glb(*arrays),
+                    repeat,
+                    n_tris,
+                    "tris/s",
+                )
+                # Previous path (trimesh mesh + scene export), for comparison
+                mesh = sr._mesh_from_profile(*profile, w, 170.0, segments)
+                _record(
+                    results,
+                    f"glb_export_trimesh/{tag}",
+                    lambda mesh=mesh: trimesh.exchange.gltf.export_glb(mesh.scene()),
+                    repeat,
+                    n_tris,
+                    "tris/s",
+                )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print median deltas vs baseline; return names slower than `threshold`."""
+    regressions = []
+    print(f"\n{'case':<48} {'base ms':>10} {'now ms':>10} {'delta':>8}")
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        delta = (cur["median_ms"] - base["median_ms"]) / max(base["median_ms"], 1e-9)
+        flag = ""
+        if delta > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<48} {base['median_ms']:>10.2f} {cur['median_ms']:>10.2f}"
+            f" {delta:>+7.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--quick", action="store_true", help="720p/1080p, 96 slices only")
+    ap.add_argument(
+        "--mediapipe",
+        choices=["auto", "on", "off"],
+        default="auto",
+        help="include the MediaPipe segmentation stage (auto: when installed)",
+    )
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--output", help="write results JSON here")
+    ap.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="regression threshold (0.10 = 10%%)",
+    )
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args(argv)
+
+    resolutions = RESOLUTIONS[:2] if args.quick else RESOLUTIONS
+    slice_counts = [96] if args.quick else SLICE_COUNTS
+    segment_counts = [48] if args.quick else SEGMENT_COUNTS
+    mediapipe = args.mediapipe == "on" or (
+        args.mediapipe == "auto" and _have_mediapipe()
+    )
+
+    results = run(resolutions, slice_counts, segment_counts, args.repeat, mediapipe)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "numpy": np.__version__,
+            "trimesh": trimesh.__version__,
+            "repeat": args.repeat,
+            "mediapipe": mediapipe,
+            # Which backend the segment/* rows measured (SEGMENTATION_BACKEND)
+            "segmentation_backend": segmentation.active_backend(),
+            "segmentation_intra_op_threads": segmentation.INTRA_OP_THREADS,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(
+            f"\nNo baseline at {args.baseline}; run with --save-baseline to create one"
+        )
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    if regressions:
+        print(
+            f"\n{len(regressions)} case(s) slower than baseline by >{args.threshold:.0%}"
+        )
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
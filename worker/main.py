@@ -1,15 +1,32 @@
+import importlib
 import ipaddress
+import json
 import logging
 import os
 import socket
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import Optional
 from urllib.parse import urlparse
 
 import httpx
+import metrics
 from fastapi import BackgroundTasks, FastAPI
-from providers.silhouette_revolve import generate_glb_from_image as gen_silhouette
-from pydantic import BaseModel, HttpUrl
+from fastapi.responses import JSONResponse, Response
+from pipeline import (
+    ComputePool,
+    load_providers,
+    output_key,
+    run_provider,
+    upload_output,
+)
+from providers import MAX_INPUT_VIEWS
+from providers.memory import MemoryStageTimer, RssSampler, start_tracing
+from providers.timing import StageTimer
+from pydantic import BaseModel, HttpUrl, model_validator
 
 # --- SSRF Protection ---
 # Blocklist of private/internal IP ranges and cloud metadata endpoints
@@ -69,105 +86,495 @@ def validate_url_safe(url: str) -> None:
         pass
 
 
-try:
-    from providers.triposr import generate_glb_from_image as gen_triposr
-except Exception:  # ImportError or other
-    gen_triposr = None  # optional
-
 app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("rapso-worker")
 
+# --- Metrics (in-process registry, scraped via GET /metrics) ---
+JOB_DURATION = metrics.histogram(
+    "rapso_worker_job_duration_seconds",
+    "End-to-end job time in the worker (status: completed, failed, or "
+    "callback_failed when the mesh was built but the backend was not told)",
+    ("provider", "status"),
+)
+JOBS_IN_FLIGHT = metrics.gauge(
+    "rapso_worker_jobs_in_flight", "Jobs currently running in this worker"
+)
+QUEUE_DEPTH = metrics.gauge(
+    "rapso_worker_queue_depth", "Accepted jobs waiting for a free compute slot"
+)
+PROVIDER_USAGE = metrics.counter(
+    "rapso_worker_provider_runs_total",
+    "Provider runs by provider actually used",
+    ("provider",),
+)
+PROVIDER_FALLBACKS = metrics.counter(
+    "rapso_worker_provider_fallbacks_total",
+    "Provider failures that fell back to another provider",
+    ("from_provider", "to_provider"),
+)
+TRANSFER_LATENCY = metrics.histogram(
+    "rapso_worker_transfer_duration_seconds",
+    "Input download / output upload latency (backend: s3 presigned or local)",
+    ("op", "backend"),
+)
+STAGE_DURATION = metrics.histogram(
+    "rapso_worker_stage_duration_seconds",
+    "Wall time per job pipeline stage",
+    ("stage",),
+)
+CALLBACKS = metrics.counter(
+    "rapso_worker_callbacks_total",
+    "Callbacks posted to the backend, by job status and outcome",
+    ("status", "outcome"),
+)
+STARTUP_DURATION = metrics.gauge(
+    "rapso_worker_startup_step_seconds",
+    "Time spent per startup import / warm-up step",
+    ("step",),
+)
+# Byte buckets for memory histograms (1 MB .. 8 GB)
+_MEMORY_BUCKETS = (1e6, 4e6, 16e6, 64e6, 128e6, 256e6, 512e6, 1e9, 2e9, 4e9, 8e9)
+STAGE_PEAK_MEMORY = metrics.histogram(
+    "rapso_worker_stage_peak_memory_bytes",
+    "Peak memory per job stage (kind: traced = tracemalloc growth, rss = process RSS)",
+    ("stage", "kind"),
+    buckets=_MEMORY_BUCKETS,
+)
+JOB_PEAK_RSS = metrics.histogram(
+    "rapso_worker_job_peak_rss_bytes",
+    "Peak process RSS while a job ran",
+    ("provider",),
+    buckets=_MEMORY_BUCKETS,
+)
+WORKER_READY = metrics.gauge(
+    "rapso_worker_ready", "1 once providers are imported and warmed up"
+)
+
+
+# --- Startup: provider modules (numpy, scipy, trimesh, mediapipe) are imported in a
+# warm-up thread so the server answers /healthz immediately; /readyz turns true once
+# the segmenter is loaded, TripoSR probed and a dummy mesh built.
+WORKER_WARMUP = os.getenv("WORKER_WARMUP", "true").lower() in ("1", "true", "yes")
+# (step, module) imported one by one so each import is timed on its own
+_STARTUP_IMPORTS = (
+    ("import_numpy", "numpy"),
+    ("import_pillow", "PIL.Image"),
+    ("import_scipy", "scipy.ndimage"),
+    ("import_trimesh", "trimesh"),
+    ("import_mediapipe", "mediapipe"),
+)
+# Silhouette compute in N separate processes (images handed over in shared memory);
+# 0 runs it in the job threads
+WORKER_COMPUTE_PROCESSES = max(0, int(os.getenv("WORKER_COMPUTE_PROCESSES", "0")))
+_compute: Optional[ComputePool] = None
+_ready = threading.Event()
+_startup = StageTimer()
+_startup_errors: dict[str, str] = {}
+_triposr_available: Optional[bool] = None
+
+
+def _startup_step(name: str, fn):
+    try:
+        with _startup.stage(name):
+            return fn()
+    except Exception as e:
+        _startup_errors[name] = f"{type(e).__name__}: {e}"
+        logger.warning("Startup step %s failed: %s", name, e)
+        return None
+    finally:
+        STARTUP_DURATION.set(_startup.stages.get(name, 0.0), step=name)
+
+
+def _configured_segmentation() -> str:
+    # SEGMENTATION_BACKEND as resolved by the provider (imported with the providers)
+    from providers import segmentation
+
+    return segmentation.BACKEND
+
+
+def _segmentation_backend() -> Optional[str]:
+    # Only known once warm-up created a segmenter in this process
+    try:
+        from providers import segmentation
+    except Exception:
+        return None
+    return segmentation.active_backend()
+
+
+def _start_compute_pool() -> None:
+    global _compute
+    pool = ComputePool(WORKER_COMPUTE_PROCESSES)
+    if WORKER_WARMUP:
+        pool.warm_up()
+    _compute = pool
+
+
+def _warm_up() -> None:
+    global _triposr_available
+    started = time.perf_counter()
+    for name, module in _STARTUP_IMPORTS:
+        _startup_step(name, lambda module=module: importlib.import_module(module))
+    providers = _startup_step("import_providers", load_providers)
+    # The onnx backend also needs onnxruntime; MediaPipe stays the fallback, so a
+    # failed import does not block readiness
+    if providers and _configured_segmentation() == "onnx":
+        _startup_step(
+            "import_onnxruntime", lambda: importlib.import_module("onnxruntime")
+        )
+    if providers and WORKER_WARMUP:
+        silhouette, triposr = providers
+        _startup_step("segmenter", silhouette.warm_up_segmenter)
+        if triposr is not None:
+            _triposr_available = bool(_startup_step("triposr_probe", triposr.probe))
+        _startup_step("dummy_mesh", silhouette.warm_up_mesh)
+    if providers and WORKER_COMPUTE_PROCESSES:
+        _startup_step("compute_pool", _start_compute_pool)
+    # TripoSR and ONNX Runtime are optional (fallbacks exist); anything else is fatal
+    optional = {"triposr_probe", "import_onnxruntime"}
+    fatal = {k: v for k, v in _startup_errors.items() if k not in optional}
+    if providers and not fatal:
+        _ready.set()
+        WORKER_READY.set(1)
+    logger.info(
+        json.dumps(
+            {
+                "event": "worker_startup",
+                "ready": _ready.is_set(),
+                "total_ms": round((time.perf_counter() - started) * 1000.0, 2),
+                "steps_ms": _startup.as_ms(),
+                "triposr_available": _triposr_available,
+                "segmentation_backend": _segmentation_backend(),
+                "errors": _startup_errors,
+            }
+        )
+    )
+
+
+# --- Optional per-job memory accounting (tracemalloc + RSS sampling per stage).
+# tracemalloc slows allocation-heavy code down, so this is off by default. With
+# WORKER_MEMORY_DEBUG_DIR set, jobs that set a new peak-RSS or duration record
+# also dump their top allocation sites there.
+WORKER_MEMORY_PROFILE = os.getenv("WORKER_MEMORY_PROFILE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+WORKER_MEMORY_DEBUG_DIR = os.getenv("WORKER_MEMORY_DEBUG_DIR")
+_rss_sampler: Optional[RssSampler] = None
+if WORKER_MEMORY_PROFILE:
+    start_tracing()
+    _rss_sampler = RssSampler()
+_memory_records = {"rss": 0, "seconds": 0.0}
+_memory_records_lock = threading.Lock()
+
+
+def _memory_payload(timer: StageTimer) -> dict:
+    if isinstance(timer, MemoryStageTimer):
+        return {"memory": timer.as_mb()}
+    return {}
+
 
+def _new_timer() -> StageTimer:
+    if _rss_sampler is None:
+        return StageTimer()
+    return MemoryStageTimer(_rss_sampler, snapshot=bool(WORKER_MEMORY_DEBUG_DIR))
+
+
+def _record_memory(job_id: str, provider: str, timer: StageTimer, elapsed: float):
+    """Export per-stage peaks and dump allocation sites for record-setting jobs."""
+    if not isinstance(timer, MemoryStageTimer):
+        return
+    for stage, peak in timer.traced_peak.items():
+        STAGE_PEAK_MEMORY.observe(peak, stage=stage, kind="traced")
+    for stage, peak in timer.rss_peak.items():
+        STAGE_PEAK_MEMORY.observe(peak, stage=stage, kind="rss")
+    peak_rss = timer.peak_rss()
+    JOB_PEAK_RSS.observe(peak_rss, provider=provider)
+    if not WORKER_MEMORY_DEBUG_DIR:
+        return
+    with _memory_records_lock:
+        reasons = []
+        if peak_rss > _memory_records["rss"]:
+            _memory_records["rss"] = peak_rss
+            reasons.append("largest")
+        if elapsed > _memory_records["seconds"]:
+            _memory_records["seconds"] = elapsed
+            reasons.append("slowest")
+    if not reasons:
+        return
+    path = os.path.join(WORKER_MEMORY_DEBUG_DIR, f"{job_id}.memory.json")
+    try:
+        os.makedirs(WORKER_MEMORY_DEBUG_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "job_id": job_id,
+                    "reason": reasons,
+                    "total_ms": round(elapsed * 1000.0, 2),
+                    "memory": timer.as_mb(),
+                    "top_allocations": timer.top_allocations(),
+                },
+                f,
+                indent=2,
+            )
+        logger.info("Memory dump for job %s (%s): %s", job_id, "+".join(reasons), path)
+    except OSError as e:
+        logger.warning("Could not write memory dump %s: %s", path, e)
+
+
+@app.on_event("startup")
+def _start_warm_up():
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def _stop_compute_pool():
+    if _compute is not None:
+        _compute.shutdown()
+
+
+# --- Capacity: at most WORKER_SLOTS jobs compute at once; the rest wait in line ---
+WORKER_SLOTS = max(1, int(os.getenv("WORKER_SLOTS", str(os.cpu_count() or 1))))
+_slots = threading.BoundedSemaphore(WORKER_SLOTS)
+_load_lock = threading.Lock()
+_waiting = 0
+_running = 0
+
+
+def _capacity() -> dict:
+    with _load_lock:
+        return {
+            "slots": WORKER_SLOTS,
+            "queue_depth": _waiting,
+            "free_slots": max(0, WORKER_SLOTS - _running),
+        }
+
+
+# async so health/capacity probes never queue behind jobs in the threadpool
 @app.get("/healthz")
-def healthz():
-    return {"worker": "ok"}
+async def healthz():
+    return {"worker": "ok", "ready": _ready.is_set(), **_capacity()}
+
+
+@app.get("/readyz")
+async def readyz():
+    """200 once warmed up (route traffic here), 503 while starting or broken."""
+    body = {
+        "ready": _ready.is_set(),
+        "startup_ms": _startup.as_ms(),
+        "triposr_available": _triposr_available,
+        "errors": _startup_errors,
+    }
+    return JSONResponse(body, status_code=200 if _ready.is_set() else 503)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _input_backend(url: str) -> str:
+    """Classify an input URL as an S3 presigned URL or the backend's local assets."""
+    return "s3" if "X-Amz-Signature" in url else "local"
 
 
 class ProcessRequest(BaseModel):
     job_id: str
-    input_url: HttpUrl
+    # Single-view jobs send input_url; multi-view jobs send input_urls (front first)
+    input_url: Optional[HttpUrl] = None
+    input_urls: list[HttpUrl] = []
     height_cm: Optional[float] = None
     callback_url: Optional[HttpUrl] = None
     provider: Optional[str] = (
         None  # e.g., 'smplx_icon' | 'tripo' | 'external_api' | 'null'
     )
 
+    @model_validator(mode="after")
+    def check_inputs(self):
+        if not self.input_urls and self.input_url is None:
+            raise ValueError("input_url or input_urls is required")
+        if len(self.input_urls) > MAX_INPUT_VIEWS:
+            raise ValueError(f"at most {MAX_INPUT_VIEWS} input_urls are supported")
+        return self
+
+    def views(self) -> list[str]:
+        return [str(u) for u in self.input_urls] or [str(self.input_url)]
+
+
+def _download_inputs(urls: list[str], td: str) -> list[str]:
+    """Fetch all input views concurrently; returns local paths in the same order."""
+
+    def fetch(args) -> str:
+        n, url = args
+        path = os.path.join(td, f"input_{n}.jpg")
+        with TRANSFER_LATENCY.time(op="get", backend=_input_backend(url)):
+            r = client.get(url)
+            r.raise_for_status()
+            with open(path, "wb") as f:
+                f.write(r.content)
+        return path
+
+    # allow long input downloads
+    with httpx.Client(timeout=300.0) as client:
+        if len(urls) == 1:
+            return [fetch((0, urls[0]))]
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            return list(pool.map(fetch, enumerate(urls)))
+
 
 def _run_job(req: ProcessRequest):
+    """Run a job once a compute slot is free (counted as queued until then)."""
+    global _waiting, _running
+    _slots.acquire()
+    with _load_lock:
+        _waiting -= 1
+        _running += 1
+        QUEUE_DEPTH.set(_waiting)
+    try:
+        _execute_job(req)
+    finally:
+        with _load_lock:
+            _running -= 1
+        _slots.release()
+
+
+def _execute_job(req: ProcessRequest):
     provider = (req.provider or "silhouette").lower()
-    logger.info("Processing job %s with provider=%s", req.job_id, provider)
-    out_key = f"outputs/{req.job_id}.glb"
+    logger.info(
+        "Processing job %s with provider=%s (%d view(s))",
+        req.job_id,
+        provider,
+        len(req.views()),
+    )
+    out_key = None
     provider_used = None
+    job_status = "failed"
+    timer = _new_timer()
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    JOBS_IN_FLIGHT.inc()
     try:
-        # SSRF validation: ensure input URL is not targeting internal resources
-        validate_url_safe(str(req.input_url))
+        # SSRF validation: ensure input URLs are not targeting internal resources
+        input_urls = req.views()
+        for url in input_urls:
+            validate_url_safe(url)
 
         with tempfile.TemporaryDirectory() as td:
-            in_path = os.path.join(td, "input.jpg")
             out_path = os.path.join(td, "output.glb")
-            with httpx.Client(timeout=300.0) as client:  # allow long input downloads
-                r = client.get(str(req.input_url))
-                r.raise_for_status()
-                with open(in_path, "wb") as f:
-                    f.write(r.content)
+            with timer.stage("download"):
+                in_paths = _download_inputs(input_urls, td)
 
             # Run provider (prefer TripoSR if requested and available)
-            if provider in {"triposr", "sf3d"} and gen_triposr is not None:
-                try:
-                    gen_triposr(in_path, out_path, req.height_cm)
-                    provider_used = "triposr"
-                except Exception as e:
-                    logger.warning(
-                        "TripoSR provider failed, falling back to silhouette: %s", e
-                    )
-                    gen_silhouette(in_path, out_path, req.height_cm)
-                    provider_used = "silhouette"
-            else:
-                gen_silhouette(in_path, out_path, req.height_cm)
-                provider_used = "silhouette"
+            provider_used = run_provider(
+                in_paths,
+                out_path,
+                provider,
+                req.height_cm,
+                timer,
+                on_fallback=lambda src, dst: PROVIDER_FALLBACKS.inc(
+                    from_provider=src, to_provider=dst
+                ),
+                compute=_compute,
+            )
+            PROVIDER_USAGE.inc(provider=provider_used)
+
+            with open(out_path, "rb") as f:
+                glb_bytes = f.read()
+            out_key = output_key(req.job_id, glb_bytes)
 
             # Upload GLB to backend dev endpoint (derive from callback_url base)
             if req.callback_url:
                 cb = urlparse(str(req.callback_url))
                 base = f"{cb.scheme}://{cb.netloc}"
-                upload_url = f"{base}/dev/upload"
-                with open(out_path, "rb") as f:
-                    files = {
-                        "file": (os.path.basename(out_key), f, "model/gltf-binary")
-                    }
-                    data = {"key": out_key}
-                    with httpx.Client(timeout=600.0) as client:  # allow long uploads
-                        ur = client.post(upload_url, files=files, data=data)
-                        ur.raise_for_status()
-
-        # Inform backend that job completed
+                with (
+                    timer.stage("upload"),
+                    TRANSFER_LATENCY.time(op="put", backend="local"),
+                ):
+                    # allow long uploads
+                    with httpx.Client(timeout=600.0) as client:
+                        upload_output(client, base, out_key, glb_bytes)
+
+        # Inform backend that job completed; only then does the job count as completed
         if req.callback_url:
-            with httpx.Client(timeout=20.0) as client:
-                r = client.post(
-                    str(req.callback_url),
-                    json={
-                        "status": "completed",
-                        "output_key": out_key,
-                        "provider_used": provider_used or provider,
-                    },
+            # Snapshot before the callback stage so the payload carries what we know
+            timings = timer.as_ms()
+            try:
+                with timer.stage("callback"), httpx.Client(timeout=20.0) as client:
+                    r = client.post(
+                        str(req.callback_url),
+                        json={
+                            "status": "completed",
+                            "output_key": out_key,
+                            "provider_used": provider_used or provider,
+                            "started_at": started_at,
+                            "timings": timings,
+                            **_memory_payload(timer),
+                        },
+                    )
+                    logger.info("Callback to %s -> %s", req.callback_url, r.status_code)
+                CALLBACKS.inc(
+                    status="completed", outcome="ok" if r.is_success else "error"
                 )
-                logger.info("Callback to %s -> %s", req.callback_url, r.status_code)
+            except Exception:
+                CALLBACKS.inc(status="completed", outcome="error")
+                job_status = "callback_failed"
+                raise
+            job_status = "completed" if r.is_success else "callback_failed"
+        else:
+            job_status = "completed"
     except Exception as e:
         logger.exception("Job %s failed: %s", req.job_id, e)
         if req.callback_url:
+            timings = timer.as_ms()
             try:
-                with httpx.Client(timeout=10.0) as client:
-                    client.post(
+                with timer.stage("callback"), httpx.Client(timeout=10.0) as client:
+                    r = client.post(
                         str(req.callback_url),
-                        json={"status": "failed", "error": str(e)},
+                        json={
+                            "status": "failed",
+                            "error": str(e),
+                            "provider_used": provider_used or provider,
+                            "started_at": started_at,
+                            "timings": timings,
+                            **_memory_payload(timer),
+                        },
                     )
+                CALLBACKS.inc(
+                    status="failed", outcome="ok" if r.is_success else "error"
+                )
             except Exception:
-                pass
+                CALLBACKS.inc(status="failed", outcome="error")
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        elapsed = time.perf_counter() - started
+        JOB_DURATION.observe(
+            elapsed, provider=provider_used or provider, status=job_status
+        )
+        for stage, secs in timer.stages.items():
+            STAGE_DURATION.observe(secs, stage=stage)
+        logger.info(
+            json.dumps(
+                {
+                    "event": "job_timings",
+                    "job_id": req.job_id,
+                    "provider": provider_used or provider,
+                    "status": job_status,
+                    "total_ms": round(elapsed * 1000.0, 2),
+                    "stages_ms": timer.as_ms(),
+                    **_memory_payload(timer),
+                }
+            )
+        )
+        _record_memory(req.job_id, provider_used or provider, timer, elapsed)
 
 
 @app.post("/process")
-def process(req: ProcessRequest, background_tasks: BackgroundTasks):
+async def process(req: ProcessRequest, background_tasks: BackgroundTasks):
+    global _waiting
+    with _load_lock:
+        _waiting += 1
+        QUEUE_DEPTH.set(_waiting)
     # Run asynchronously to avoid backend request timeouts
     background_tasks.add_task(_run_job, req)
     return {"ok": True, "job_id": req.job_id, "status": "processing"}
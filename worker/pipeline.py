@@ -0,0 +1,183 @@
+"""Provider pipeline shared by the HTTP worker (`main.py`) and the batch CLI (`batch.py`).
+
+Provider modules pull in numpy, scipy, trimesh and MediaPipe, so they are imported
+on first use rather than at module import.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from multiprocessing import get_context
+from typing import Callable, Optional, Sequence
+
+import httpx
+from providers import MAX_INPUT_VIEWS
+from providers.timing import StageTimer
+
+logger = logging.getLogger("rapso-worker")
+
+_providers_lock = threading.Lock()
+_providers = None
+
+
+def load_providers():
+    """Import the provider modules once; returns (silhouette_revolve, triposr or None)."""
+    global _providers
+    with _providers_lock:
+        if _providers is None:
+            from providers import silhouette_revolve
+
+            try:
+                from providers import triposr
+            except Exception:  # ImportError or other
+                triposr = None  # optional
+            _providers = (silhouette_revolve, triposr)
+    return _providers
+
+
+def _compute_init() -> None:
+    # Import providers and load a segmentation graph once per compute process
+    silhouette, _ = load_providers()
+    silhouette.warm_up_segmenter()
+
+
+def _compute_warm_up() -> int:
+    # Build and export a dummy mesh so the first job does not pay for it
+    silhouette, _ = load_providers()
+    return silhouette.warm_up_mesh()
+
+
+def _compute_silhouette(
+    handles: list, out_path: str, height_cm: Optional[float]
+) -> dict[str, float]:
+    """Compute-process side: segment, profile and mesh views of shared memory."""
+    from providers.shm import attach
+
+    silhouette, _ = load_providers()
+    timer = StageTimer()
+    with ExitStack() as stack:
+        images = [stack.enter_context(attach(h)) for h in handles]
+        try:
+            silhouette.generate_glb_from_arrays(images, out_path, height_cm, timer)
+        finally:
+            # Views must be gone before the mappings close
+            images.clear()
+    return timer.stages
+
+
+class ComputePool:
+    """Silhouette compute in separate processes, fed through shared memory.
+
+    The calling (I/O) thread decodes each view into a shared-memory segment; a
+    compute process maps the segments and runs segmentation, morphology, profile,
+    mesh and GLB export on NumPy views of them, writing the GLB to `out_path`. Only
+    the segment names and the stage timings cross the process boundary. The caller
+    owns the segments and unlinks them when the job finishes or fails.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        # spawn: MediaPipe graphs are not fork-safe
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_compute_init,
+        )
+
+    def warm_up(self) -> None:
+        """Start the compute processes (the initializer imports the providers and
+        loads a segmenter) and build a dummy mesh in each before the first job."""
+        futures = [
+            self._executor.submit(_compute_warm_up) for _ in range(self.processes)
+        ]
+        for f in futures:
+            f.result()
+
+    def run(
+        self,
+        in_paths: Sequence[str],
+        out_path: str,
+        height_cm: Optional[float],
+        timer: StageTimer,
+    ) -> None:
+        from providers.shm import decode_image
+
+        with ExitStack() as stack:
+            with timer.stage("decode"):
+                shared = [
+                    stack.enter_context(decode_image(p))
+                    for p in list(in_paths)[:MAX_INPUT_VIEWS]
+                ]
+            stages = self._executor.submit(
+                _compute_silhouette,
+                [s.handle() for s in shared],
+                out_path,
+                height_cm,
+            ).result()
+        for name, secs in stages.items():
+            timer.stages[name] = timer.stages.get(name, 0.0) + secs
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_provider(
+    in_paths: Sequence[str],
+    out_path: str,
+    provider: Optional[str],
+    height_cm: Optional[float],
+    timer: StageTimer,
+    on_fallback: Optional[Callable[[str, str], None]] = None,
+    compute: Optional[ComputePool] = None,
+) -> str:
+    """Write a GLB for the input views (front first) to `out_path`; returns the
+    provider actually used.
+
+    TripoSR is used when requested and installed (front view only), falling back to
+    the silhouette provider if it fails. With a `compute` pool the silhouette
+    provider runs there instead of in the calling thread.
+    """
+    provider = (provider or "silhouette").lower()
+    silhouette, triposr = load_providers()
+    if provider in {"triposr", "sf3d"} and triposr is not None:
+        try:
+            triposr.generate_glb_from_image(
+                in_paths[0], out_path, height_cm, timer=timer
+            )
+            return "triposr"
+        except Exception as e:
+            logger.warning("TripoSR provider failed, falling back to silhouette: %s", e)
+            if on_fallback:
+                on_fallback("triposr", "silhouette")
+    if compute is not None:
+        compute.run(in_paths, out_path, height_cm, timer)
+    else:
+        silhouette.generate_glb_from_images(in_paths, out_path, height_cm, timer=timer)
+    return "silhouette"
+
+
+def output_key(job_id: str, glb_bytes: bytes) -> str:
+    """Content-hashed output key; the backend serves these as immutable."""
+    digest = hashlib.sha256(glb_bytes).hexdigest()[:16]
+    return f"outputs/{job_id}.{digest}.glb"
+
+
+def upload_output(
+    client: httpx.Client,
+    backend_url: str,
+    key: str,
+    glb_bytes: bytes,
+    api_key: Optional[str] = None,
+) -> None:
+    """Store a GLB through the backend's storage layer (`/dev/upload` -> S3/R2 or local)."""
+    headers = {"X-API-Key": api_key} if api_key else None
+    r = client.post(
+        f"{backend_url.rstrip('/')}/dev/upload",
+        files={"file": (os.path.basename(key), glb_bytes, "model/gltf-binary")},
+        data={"key": key},
+        headers=headers,
+    )
+    r.raise_for_status()
@@ -1,4 +1,13 @@
+# Input views per job: front, then optionally side. The backend, the worker API and
+# the silhouette provider all use this limit.
+MAX_INPUT_VIEWS = 2
+
 __all__ = [
+    "glb",
+    "memory",
+    "segmentation",
+    "shm",
     "silhouette_revolve",
+    "timing",
     "triposr",
 ]
@@ -0,0 +1,147 @@
+"""Minimal binary glTF 2.0 (GLB) writer for a single indexed triangle mesh.
+
+Writes the JSON chunk and then the vertex/index arrays straight from their NumPy
+buffers into the BIN chunk, so each array is copied at most once (only when it is
+not already contiguous in the glTF component type). No scene graph, materials or
+validation beyond what the format needs; general meshes (TripoSR OBJ/PLY
+conversion) still go through trimesh.
+"""
+
+import io
+import json
+import struct
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+_GLB_MAGIC = 0x46546C67  # "glTF"
+_CHUNK_JSON = 0x4E4F534A
+_CHUNK_BIN = 0x004E4942
+_FLOAT = 5126
+_UNSIGNED_SHORT = 5123
+_UNSIGNED_INT = 5125
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+
+
+def _pad4(n: int) -> int:
+    return (4 - n % 4) % 4
+
+
+def vertex_normals(vertices: np.ndarray, faces: np.ndarray) -> np.ndarray:
+    """Area-weighted smooth vertex normals (float32, unit length)."""
+    v = vertices.astype(np.float64, copy=False)
+    tri = v[faces]
+    face_n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    normals = np.zeros_like(v)
+    for k in range(3):
+        np.add.at(normals, faces[:, k], face_n)
+    length = np.linalg.norm(normals, axis=1)
+    # Vertices touching only degenerate faces (revolve poles) point along the axis
+    flat = length < 1e-12
+    normals[flat] = (0.0, 1.0, 0.0)
+    length[flat] = 1.0
+    return (normals / length[:, None]).astype(np.float32)
+
+
+def write_glb(
+    f: BinaryIO,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    normals: Optional[np.ndarray] = None,
+) -> int:
+    """Write an indexed triangle mesh as GLB to `f`; returns bytes written.
+
+    `vertices` (N, 3) and optional `normals` (N, 3) are stored as float32, `faces`
+    (M, 3) as uint16 when N fits, else uint32.
+    """
+    positions = np.ascontiguousarray(vertices, dtype=np.float32)
+    index_type = np.uint16 if len(positions) <= 0xFFFF else np.uint32
+    indices = np.ascontiguousarray(faces, dtype=index_type)
+    arrays = [positions]
+    if normals is not None:
+        arrays.append(np.ascontiguousarray(normals, dtype=np.float32))
+    arrays.append(indices)
+
+    buffer_views = []
+    offset = 0
+    for i, arr in enumerate(arrays):
+        view = {"buffer": 0, "byteOffset": offset, "byteLength": arr.nbytes}
+        view["target"] = (
+            _ELEMENT_ARRAY_BUFFER if i == len(arrays) - 1 else _ARRAY_BUFFER
+        )
+        buffer_views.append(view)
+        offset += arr.nbytes + _pad4(arr.nbytes)
+    bin_length = offset
+
+    accessors = [
+        {
+            "bufferView": 0,
+            "componentType": _FLOAT,
+            "count": len(positions),
+            "type": "VEC3",
+            # Required for POSITION
+            "min": positions.min(axis=0).tolist() if len(positions) else [0, 0, 0],
+            "max": positions.max(axis=0).tolist() if len(positions) else [0, 0, 0],
+        }
+    ]
+    attributes = {"POSITION": 0}
+    if normals is not None:
+        accessors.append(
+            {
+                "bufferView": 1,
+                "componentType": _FLOAT,
+                "count": len(positions),
+                "type": "VEC3",
+            }
+        )
+        attributes["NORMAL"] = 1
+    accessors.append(
+        {
+            "bufferView": len(arrays) - 1,
+            "componentType": (
+                _UNSIGNED_SHORT if index_type is np.uint16 else _UNSIGNED_INT
+            ),
+            "count": int(indices.size),
+            "type": "SCALAR",
+        }
+    )
+    gltf = {
+        "asset": {"version": "2.0", "generator": "rapso"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [
+            {
+                "primitives": [
+                    {"attributes": attributes, "indices": len(accessors) - 1, "mode": 4}
+                ]
+            }
+        ],
+        "accessors": accessors,
+        "bufferViews": buffer_views,
+        "buffers": [{"byteLength": bin_length}],
+    }
+    json_bytes = json.dumps(gltf, separators=(",", ":")).encode()
+    json_bytes += b" " * _pad4(len(json_bytes))
+    total = 12 + 8 + len(json_bytes) + 8 + bin_length
+
+    f.write(struct.pack("<III", _GLB_MAGIC, 2, total))
+    f.write(struct.pack("<II", len(json_bytes), _CHUNK_JSON))
+    f.write(json_bytes)
+    f.write(struct.pack("<II", bin_length, _CHUNK_BIN))
+    for arr in arrays:
+        # memoryview.cast rejects zero-size arrays
+        if arr.nbytes:
+            f.write(memoryview(arr).cast("B"))
+            f.write(b"\0" * _pad4(arr.nbytes))
+    return total
+
+
+def encode_glb(
+    vertices: np.ndarray, faces: np.ndarray, normals: Optional[np.ndarray] = None
+) -> bytes:
+    """`write_glb` into memory."""
+    buf = io.BytesIO()
+    write_glb(buf, vertices, faces, normals)
+    return buf.getvalue()
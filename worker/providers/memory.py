@@ -0,0 +1,199 @@
+"""Per-stage peak memory accounting for a job (tracemalloc + RSS sampling).
+
+`MemoryStageTimer` is a drop-in `StageTimer`: the providers already wrap their
+stages in `timer.stage(...)`, so passing one records, per stage, the peak traced
+Python/NumPy allocation above the stage's starting point and the peak process RSS
+seen by a background sampler. Each stage keeps its own RSS maximum, and the shared
+tracemalloc peak is only reset when no other stage is being measured, so one job
+never clears another's reading. Both measurements are process-wide, though: with
+more than one job running at once the numbers include the other jobs and are upper
+bounds, so size containers from runs with WORKER_SLOTS=1.
+"""
+
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .timing import StageTimer
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # non-POSIX
+    _PAGE_SIZE = 4096
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None where unsupported)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        # Peak, not current, but the best macOS/BSD offer without psutil
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+    except Exception:
+        return None
+
+
+class RssPeak:
+    """Peak RSS in bytes seen while a `RssSampler.watch()` block was open."""
+
+    def __init__(self, start: int):
+        self.value = start
+
+
+class RssSampler:
+    """Daemon thread sampling RSS into every open `watch()`."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self._watches: set[RssPeak] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        rss = current_rss() or 0
+        with self._lock:
+            for peak in self._watches:
+                peak.value = max(peak.value, rss)
+
+    @contextmanager
+    def watch(self) -> Iterator[RssPeak]:
+        """Track the peak RSS for the duration of the block, independently of any
+        other open watch."""
+        peak = RssPeak(current_rss() or 0)
+        with self._lock:
+            self._watches.add(peak)
+        try:
+            yield peak
+        finally:
+            self._sample()
+            with self._lock:
+                self._watches.discard(peak)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+
+def start_tracing(frames: int = 1) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+# Stages currently reading the shared tracemalloc peak
+_traced_lock = threading.Lock()
+_traced_active = 0
+
+
+def _begin_traced() -> int:
+    """Start a traced measurement; returns the traced size at its start."""
+    global _traced_active
+    with _traced_lock:
+        if _traced_active == 0:
+            # Only safe while nobody else is measuring
+            tracemalloc.reset_peak()
+        _traced_active += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _end_traced() -> tuple[int, int]:
+    """End a traced measurement; returns (current, peak since the oldest open one)."""
+    global _traced_active
+    with _traced_lock:
+        _traced_active -= 1
+        return tracemalloc.get_traced_memory()
+
+
+class MemoryStageTimer(StageTimer):
+    """StageTimer that also records per-stage peak memory.
+
+    With `snapshot=True` it keeps the tracemalloc snapshot taken at the end of the
+    stage holding the most traced memory, for `top_allocations()`.
+    """
+
+    def __init__(self, sampler: RssSampler, snapshot: bool = False):
+        super().__init__()
+        self.sampler = sampler
+        self.traced_peak: dict[str, int] = {}
+        self.rss_peak: dict[str, int] = {}
+        self.rss_start = current_rss() or 0
+        self._snapshot_enabled = snapshot and tracemalloc.is_tracing()
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_stage: Optional[str] = None
+        self._snapshot_bytes = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            base = _begin_traced()
+        try:
+            with self.sampler.watch() as rss, super().stage(name):
+                yield
+        finally:
+            if tracing:
+                current, peak = _end_traced()
+                self.traced_peak[name] = max(self.traced_peak.get(name, 0), peak - base)
+                if self._snapshot_enabled and current > self._snapshot_bytes:
+                    # Locals of the stage are still alive here, so this shows
+                    # where the memory held at this point was allocated
+                    self._snapshot = tracemalloc.take_snapshot()
+                    self._snapshot_stage = name
+                    self._snapshot_bytes = current
+            self.rss_peak[name] = max(self.rss_peak.get(name, 0), rss.value)
+
+    def peak_rss(self) -> int:
+        return max(self.rss_peak.values(), default=self.rss_start)
+
+    def as_mb(self) -> dict:
+        """Per-stage peaks in MB for logs and the callback payload."""
+        return {
+            "rss_start_mb": round(self.rss_start / 1e6, 2),
+            "rss_peak_mb": round(self.peak_rss() / 1e6, 2),
+            "stages": {
+                name: {
+                    "traced_peak_mb": (
+                        round(self.traced_peak[name] / 1e6, 2)
+                        if name in self.traced_peak
+                        else None
+                    ),
+                    "rss_peak_mb": round(self.rss_peak.get(name, 0) / 1e6, 2),
+                }
+                for name in self.stages
+            },
+        }
+
+    def top_allocations(self, limit: int = 25) -> list[dict]:
+        """Largest allocation sites in the kept snapshot (empty if none)."""
+        if self._snapshot is None:
+            return []
+        snapshot = self._snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        return [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "stage": self._snapshot_stage,
+                "size_mb": round(stat.size / 1e6, 3),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
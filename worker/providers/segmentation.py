@@ -0,0 +1,158 @@
+"""Person segmentation backends for the silhouette provider.
+
+A segmenter maps an HxWx3 uint8 RGB image to an HxW boolean person mask. Two
+backends are available, picked with SEGMENTATION_BACKEND:
+
+* ``mediapipe`` (default): MediaPipe SelfieSegmentation, landscape model.
+* ``onnx``: any single-input person-segmentation model (e.g. the MediaPipe selfie
+  model exported to ONNX) run on ONNX Runtime's CPU provider, with explicit
+  intra-/inter-op thread counts, an optional int8-quantized variant and a fixed
+  input resolution. If onnxruntime or the model is missing, MediaPipe is used.
+
+onnxruntime is not a declared dependency; install it where this backend is used
+(``uv pip install onnxruntime``).
+"""
+
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Optional, Protocol
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("rapso-worker")
+
+BACKEND = os.getenv("SEGMENTATION_BACKEND", "mediapipe").lower()
+ONNX_MODEL = os.getenv("SEGMENTATION_ONNX_MODEL", "")
+ONNX_INT8_MODEL = os.getenv("SEGMENTATION_ONNX_INT8_MODEL", "")
+# fp32 | int8 (int8 needs SEGMENTATION_ONNX_INT8_MODEL; falls back to fp32)
+ONNX_PRECISION = os.getenv("SEGMENTATION_ONNX_PRECISION", "fp32").lower()
+# 0 lets ONNX Runtime use every core; with N processes use cores / N
+INTRA_OP_THREADS = int(os.getenv("SEGMENTATION_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("SEGMENTATION_INTER_OP_THREADS", "1"))
+# WxH fed to the model when its input shape is dynamic
+INPUT_SIZE = os.getenv("SEGMENTATION_INPUT_SIZE", "256x256")
+THRESHOLD = 0.5
+
+_active: Optional[str] = None
+_active_lock = threading.Lock()
+
+
+class Segmenter(Protocol):
+    name: str
+
+    def segment(self, img_rgb: np.ndarray) -> np.ndarray:
+        """HxW boolean person mask for an HxWx3 uint8 RGB image."""
+        ...
+
+
+class MediaPipeSegmenter:
+    name = "mediapipe"
+
+    def __init__(self):
+        # Imported here so mask/mesh stages (and benchmarks) work without MediaPipe
+        import mediapipe as mp
+
+        self._graph = mp.solutions.selfie_segmentation.SelfieSegmentation(
+            model_selection=1
+        )
+
+    def segment(self, img_rgb: np.ndarray) -> np.ndarray:
+        return self._graph.process(img_rgb).segmentation_mask >= THRESHOLD
+
+
+def _parse_size(value: str) -> tuple[int, int]:
+    w, _, h = value.lower().partition("x")
+    return int(w), int(h or w)
+
+
+@lru_cache(maxsize=None)
+def _load_session(model_path: str, intra_op: int, inter_op: int):
+    """One InferenceSession per model, shared by every segmenter (run() is
+    thread-safe), so the thread pools are sized once per process."""
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_op
+    opts.inter_op_num_threads = inter_op
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(
+        model_path, sess_options=opts, providers=["CPUExecutionProvider"]
+    )
+
+
+class OnnxSegmenter:
+    """ONNX Runtime CPU segmenter for models with one float image input
+    (NHWC or NCHW, RGB in [0, 1]) and a person probability output."""
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_path: str,
+        intra_op_threads: int = INTRA_OP_THREADS,
+        inter_op_threads: int = INTER_OP_THREADS,
+        input_size: str = INPUT_SIZE,
+    ):
+        self.session = _load_session(model_path, intra_op_threads, inter_op_threads)
+        inp = self.session.get_inputs()[0]
+        self._input_name = inp.name
+        shape = list(inp.shape)
+        # Channels-last unless the second dim is the 3 colour channels
+        self._nchw = len(shape) == 4 and shape[1] == 3
+        dims = shape[2:4] if self._nchw else shape[1:3]
+        if all(isinstance(d, int) and d > 0 for d in dims):
+            self.input_hw = (dims[0], dims[1])
+        else:
+            w, h = _parse_size(input_size)
+            self.input_hw = (h, w)
+
+    def segment(self, img_rgb: np.ndarray) -> np.ndarray:
+        h, w = img_rgb.shape[:2]
+        in_h, in_w = self.input_hw
+        small = Image.fromarray(img_rgb).resize((in_w, in_h), Image.BILINEAR)
+        x = np.asarray(small, dtype=np.float32) * (1.0 / 255.0)
+        x = x.transpose(2, 0, 1)[None] if self._nchw else x[None]
+        out = self.session.run(None, {self._input_name: x})[0]
+        prob = np.squeeze(out)
+        if prob.ndim == 3:
+            # Per-class maps: take the last (person) channel
+            prob = prob[-1] if prob.shape[0] <= 4 else prob[..., -1]
+        prob = Image.fromarray(prob.astype(np.float32), mode="F")
+        return np.asarray(prob.resize((w, h), Image.BILINEAR)) >= THRESHOLD
+
+
+def _onnx_model_path() -> str:
+    if ONNX_PRECISION == "int8":
+        if ONNX_INT8_MODEL and os.path.exists(ONNX_INT8_MODEL):
+            return ONNX_INT8_MODEL
+        logger.warning("int8 segmentation model not found; using the fp32 model")
+    if not ONNX_MODEL:
+        raise FileNotFoundError("SEGMENTATION_ONNX_MODEL is not set")
+    return ONNX_MODEL
+
+
+def create_segmenter() -> Segmenter:
+    """A new segmenter for the configured backend, falling back to MediaPipe."""
+    global _active
+    seg: Optional[Segmenter] = None
+    if BACKEND == "onnx":
+        try:
+            seg = OnnxSegmenter(_onnx_model_path())
+        except Exception as e:  # ImportError, missing or unreadable model
+            logger.warning("ONNX segmentation unavailable, using MediaPipe: %s", e)
+    elif BACKEND != "mediapipe":
+        logger.warning("Unknown SEGMENTATION_BACKEND %r, using MediaPipe", BACKEND)
+    if seg is None:
+        seg = MediaPipeSegmenter()
+    with _active_lock:
+        _active = seg.name
+    return seg
+
+
+def active_backend() -> Optional[str]:
+    """Backend of the most recently created segmenter (None before the first)."""
+    return _active
@@ -0,0 +1,86 @@
+"""NumPy arrays backed by `multiprocessing.shared_memory`, for handing decoded
+images to compute processes without pickling the pixels.
+
+The creating process owns the segment: it fills `SharedArray.array`, passes
+`handle()` (name, shape, dtype; a few bytes) to the other process, and calls
+`close()` once the consumer is done, which unlinks the segment. Consumers map
+it with `attach(handle)`, which closes their mapping on exit and never unlinks.
+Views obtained from either side are only valid while the mapping is open.
+"""
+
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterator, Tuple
+
+import numpy as np
+from PIL import Image
+
+# (segment name, shape, dtype string)
+Handle = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedArray:
+    """Owner side of a shared-memory NumPy array."""
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.uint8):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def handle(self) -> Handle:
+        return (self._shm.name, self.shape, self.dtype.str)
+
+    def close(self) -> None:
+        """Drop the view and free the segment (idempotent)."""
+        if self._shm is None:
+            return
+        # The mapping cannot be closed while a NumPy view still exports it
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@contextmanager
+def attach(handle: Handle) -> Iterator[np.ndarray]:
+    """Map a segment created elsewhere and yield a NumPy view of it."""
+    name, shape, dtype = handle
+    shm = shared_memory.SharedMemory(name=name)
+    view = None
+    try:
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        yield view
+    except BaseException:
+        del view
+        try:
+            shm.close()
+        except BufferError:
+            # The in-flight traceback still references views; the mapping is
+            # released with it. Do not mask the original error.
+            pass
+        raise
+    # The caller must not keep views past this point
+    del view
+    shm.close()
+
+
+def decode_image(path: str) -> SharedArray:
+    """Decode an image file to RGB straight into a new shared-memory array."""
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        shared = SharedArray((img.height, img.width, 3), np.uint8)
+        try:
+            # Pillow exports pixels via one bytes copy; this writes them in place
+            shared.array[...] = np.asarray(img)
+        except BaseException:
+            shared.close()
+            raise
+    return shared
@@ -1,132 +1,389 @@
+import heapq
 import math
-from typing import Tuple
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
 
 import numpy as np
 from PIL import Image
-import mediapipe as mp
-import trimesh
 from scipy.ndimage import binary_opening, binary_closing
 
+from . import MAX_INPUT_VIEWS
+from .glb import encode_glb, vertex_normals, write_glb
+from .segmentation import create_segmenter
+from .timing import StageTimer
 
-def _segment_person(img_rgb: np.ndarray) -> np.ndarray:
-    """Return a binary mask (uint8 0/255) for the person using MediaPipe SelfieSegmentation.
+if TYPE_CHECKING:
+    import trimesh
 
-    Args:
-        img_rgb: HxWx3 RGB image as numpy array (uint8).
+# Adaptive ring placement: triangle budget for the revolved mesh and the allowed
+# profile error as a fraction of the widest half-width
+TRIANGLE_BUDGET = int(os.getenv("SILHOUETTE_TRIANGLE_BUDGET", "6000"))
+PROFILE_TOLERANCE = float(os.getenv("SILHOUETTE_PROFILE_TOLERANCE", "0.01"))
+RADIAL_SEGMENTS = 48
+MIN_SLICES = 8
+# Smooth vertex normals in the GLB (viewers shade flat without them)
+GLB_NORMALS = os.getenv("SILHOUETTE_GLB_NORMALS", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+
+# Loaded segmenters (see providers.segmentation) kept across jobs; one per
+# concurrent caller
+_segmenters: queue.SimpleQueue = queue.SimpleQueue()
+
+
+def _segment_raw(img_rgb: np.ndarray) -> np.ndarray:
+    """Return the raw boolean person mask from the configured segmentation backend."""
+    try:
+        seg = _segmenters.get_nowait()
+    except queue.Empty:
+        seg = create_segmenter()
+    try:
+        return seg.segment(img_rgb)
+    finally:
+        _segmenters.put(seg)
+
+
+def warm_up_segmenter() -> None:
+    """Load and run segmentation graphs so the first job does not pay for them.
+
+    Two at once, so a front + side job finds one per view.
     """
-    with mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=1) as seg:
-        res = seg.process(img_rgb)
-        mask_bool = res.segmentation_mask >= 0.5
-    # Morphological clean up (opening then closing)
+    _map_views(_segment_raw, [np.zeros((256, 256, 3), dtype=np.uint8)] * 2)
+
+
+def warm_up_mesh() -> int:
+    """Build and export a mesh from a synthetic silhouette; returns the GLB size."""
+    h, w = 256, 128
+    yy, xx = np.mgrid[0:h, 0:w]
+    mask = (((yy - h / 2) / (h * 0.45)) ** 2 + ((xx - w / 2) / (w * 0.3)) ** 2) <= 1.0
+    mask = _clean_mask(mask)
+    ys_norm, half_widths_px, bbox = _profile_from_mask(mask)
+    verts, faces = _revolve_profile(ys_norm, half_widths_px, None)
+    return len(encode_glb(verts, faces, vertex_normals(verts, faces)))
+
+
+def _clean_mask(mask_bool: np.ndarray) -> np.ndarray:
+    """Morphological clean up (opening then closing); returns uint8 0/255."""
     kernel = np.ones((5, 5), dtype=bool)
     mask_bool = binary_opening(mask_bool, structure=kernel)
     mask_bool = binary_closing(mask_bool, structure=kernel)
-    mask = mask_bool.astype(np.uint8) * 255
-    return mask
+    return mask_bool.astype(np.uint8) * 255
+
+
+def _segment_person(img_rgb: np.ndarray) -> np.ndarray:
+    """Return a binary mask (uint8 0/255) for the person (SEGMENTATION_BACKEND).
+
+    Args:
+        img_rgb: HxWx3 RGB image as numpy array (uint8).
+    """
+    return _clean_mask(_segment_raw(img_rgb))
+
+
+def _row_half_widths(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Full-resolution half-width per row (0 for empty rows) and the occupancy."""
+    occupied = mask > 0
+    any_row = occupied.any(axis=1)
+    w = mask.shape[1]
+    xmin = occupied.argmax(axis=1)
+    xmax = w - 1 - occupied[:, ::-1].argmax(axis=1)
+    half = np.where(any_row, (xmax - xmin) / 2.0, 0.0)
+    return half.astype(np.float32), occupied
+
+
+def _adaptive_rows(
+    profile: np.ndarray, tolerance_px: float, max_slices: int
+) -> np.ndarray:
+    """Pick rows so linear interpolation between them stays within `tolerance_px`.
+
+    Greedy refinement: starting from the end rows, repeatedly split the span whose
+    worst interpolation error against the full profile is largest, until every span
+    is within tolerance or `max_slices` rows are used. Rings therefore concentrate
+    where the width changes fast (head, shoulders, hips) and stay sparse on flat
+    stretches (torso, shins). A 2D `profile` (rows x profiles, e.g. width and depth)
+    uses the worst error over its columns.
+    """
+    n = len(profile)
+    if n <= 2:
+        return np.arange(n)
+
+    def worst(a: int, b: int) -> Tuple[float, int]:
+        if b - a < 2:
+            return 0.0, a
+        ys = np.arange(a + 1, b)
+        t = (ys - a) / (b - a)
+        if profile.ndim > 1:
+            t = t[:, None]
+        line = profile[a] + (profile[b] - profile[a]) * t
+        err = np.abs(profile[a + 1 : b] - line)
+        if err.ndim > 1:
+            err = err.max(axis=1)
+        i = int(err.argmax())
+        return float(err[i]), a + 1 + i
+
+    rows = {0, n - 1}
+    err, split = worst(0, n - 1)
+    heap = [(-err, 0, n - 1, split)]
+    while heap and len(rows) < max_slices:
+        neg_err, a, b, split = heapq.heappop(heap)
+        if -neg_err <= tolerance_px:
+            break
+        rows.add(split)
+        for lo, hi in ((a, split), (split, b)):
+            e, m = worst(lo, hi)
+            if e > 0.0:
+                heapq.heappush(heap, (-e, lo, hi, m))
+    return np.array(sorted(rows), dtype=np.int32)
+
+
+def _bbox(occupied: np.ndarray) -> Tuple[int, int, int, int]:
+    """(ymin, ymax, xmin, xmax) of the mask, or the whole image if degenerate."""
+    h, w = occupied.shape
+    rows = np.flatnonzero(occupied.any(axis=1))
+    cols = np.flatnonzero(occupied.any(axis=0))
+    if rows.size < 2 or cols.size < 2:
+        return (0, h - 1, 0, w - 1)
+    return (int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1]))
+
+
+def _side_half_depths(
+    side_mask: np.ndarray, bbox: Tuple[int, int, int, int], image_height: int
+) -> np.ndarray:
+    """Side-view half-widths (body half-depth) resampled onto the front view's rows.
+
+    Both silhouettes are stretched to the same top-to-bottom extent, so the result is
+    in front-view pixels and the two photos may differ in framing and resolution.
+    """
+    side_full, side_occupied = _row_half_widths(side_mask)
+    side_bbox = _bbox(side_occupied)
+    front_span = max(1.0, float(bbox[1] - bbox[0]))
+    side_span = max(1.0, float(side_bbox[1] - side_bbox[0]))
+    t = (np.arange(image_height) - bbox[0]) / front_span
+    side_rows = side_bbox[0] + t * side_span
+    depths = np.interp(
+        side_rows, np.arange(len(side_full)), side_full, left=0.0, right=0.0
+    )
+    return (depths * (front_span / side_span)).astype(np.float32)
+
+
+def _sample_rows(
+    profile: np.ndarray,
+    bbox: Tuple[int, int, int, int],
+    num_slices: Optional[int],
+    max_slices: Optional[int],
+    tolerance: float,
+) -> np.ndarray:
+    """Rows at which to place rings for a full-resolution (rows x ...) profile."""
+    h = len(profile)
+    if num_slices is not None:
+        return np.linspace(0, h - 1, num_slices).astype(np.int32)
+    if max_slices is None:
+        max_slices = TRIANGLE_BUDGET // (2 * RADIAL_SEGMENTS) + 1
+    # One empty row beyond each end closes the revolved surface at the poles
+    top, bottom = max(0, bbox[0] - 1), min(h - 1, bbox[1] + 1)
+    span = profile[top : bottom + 1]
+    tolerance_px = max(0.5, tolerance * float(span.max(initial=0.0)))
+    return top + _adaptive_rows(span, tolerance_px, max(MIN_SLICES, max_slices))
 
 
 def _profile_from_mask(
-    mask: np.ndarray, num_slices: int = 96
+    mask: np.ndarray,
+    num_slices: Optional[int] = None,
+    max_slices: Optional[int] = None,
+    tolerance: float = PROFILE_TOLERANCE,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Compute silhouette half-width profile per row and normalize.
 
+    By default rows are placed adaptively (see `_adaptive_rows`) within
+    `tolerance` x the widest half-width, using at most `max_slices` rows (defaults
+    to what TRIANGLE_BUDGET allows at RADIAL_SEGMENTS). `num_slices` gives the old
+    evenly spaced sampling over the whole image.
+
     Returns tuple of (ys_norm, half_widths_px, bbox) where bbox=(ymin,ymax,xmin,xmax).
     """
-    h, w = mask.shape
-    ys = np.linspace(0, h - 1, num_slices).astype(np.int32)
-    half_widths = []
-    xmin_all, xmax_all, ymin_all, ymax_all = w, 0, h, 0
-    for y in ys:
-        row = mask[y]
-        xs = np.where(row > 0)[0]
-        if xs.size:
-            xmin, xmax = int(xs.min()), int(xs.max())
-            xmin_all = min(xmin_all, xmin)
-            xmax_all = max(xmax_all, xmax)
-            ymin_all = min(ymin_all, y)
-            ymax_all = max(ymax_all, y)
-            half_widths.append((xmax - xmin) / 2.0)
-        else:
-            half_widths.append(0.0)
-    half_widths = np.array(half_widths, dtype=np.float32)
-    bbox = (ymin_all, ymax_all, xmin_all, xmax_all)
-    # Avoid degenerate bbox
-    if ymax_all <= ymin_all or xmax_all <= xmin_all:
-        bbox = (0, h - 1, 0, w - 1)
+    full, occupied = _row_half_widths(mask)
+    bbox = _bbox(occupied)
+    ys = _sample_rows(full, bbox, num_slices, max_slices, tolerance)
     ys_norm = (ys - bbox[0]) / max(1.0, (bbox[1] - bbox[0]))
-    return ys_norm, half_widths, bbox
+    return ys_norm, full[ys], bbox
 
 
-def _mesh_from_profile(
+def _profiles_from_masks(
+    front_mask: np.ndarray,
+    side_mask: np.ndarray,
+    max_slices: Optional[int] = None,
+    tolerance: float = PROFILE_TOLERANCE,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Front half-width and side half-depth profiles sampled at shared rows.
+
+    Rings go wherever either profile needs them (chest and seat show up in depth
+    only). Returns (ys_norm, half_widths_px, half_depths_px, bbox), all in front-view
+    pixels.
+    """
+    full, occupied = _row_half_widths(front_mask)
+    bbox = _bbox(occupied)
+    # Depth only exists where the front view has the body
+    depths = _side_half_depths(side_mask, bbox, len(full))
+    depths = np.where(full > 0, depths, 0.0).astype(np.float32)
+    ys = _sample_rows(
+        np.column_stack([full, depths]), bbox, None, max_slices, tolerance
+    )
+    ys_norm = (ys - bbox[0]) / max(1.0, (bbox[1] - bbox[0]))
+    return ys_norm, full[ys], depths[ys], bbox
+
+
+def _revolve_profile(
     ys_norm: np.ndarray,
     half_widths_px: np.ndarray,
-    bbox: Tuple[int, int, int, int],
-    image_width: int,
     height_cm: float | None,
-    radial_segments: int = 48,
-) -> trimesh.Trimesh:
-    """Revolve the 2D silhouette profile around the vertical axis to create a coarse body mesh.
+    radial_segments: int = RADIAL_SEGMENTS,
+    half_depths_px: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Revolve the 2D silhouette profile around the vertical axis.
 
-    Height scaling: scale Y dimension to height_cm (metres). Radii are scaled so that the
-    maximum observed half-width maps to roughly 0.125 * height_m (half of 25% of height).
+    Returns (vertices float32 (R*S, 3), faces uint32 (2*(R-1)*S, 3)) for R rings of
+    S = `radial_segments` vertices. Height scaling: scale Y dimension to height_cm
+    (metres). Radii are scaled so that the maximum observed half-width maps to
+    roughly 0.125 * height_m (half of 25% of height). With `half_depths_px` (side
+    view, same pixel scale) the rings are ellipses with that Z semi-axis instead of
+    circles. Raises ValueError for fewer than 2 rings (no faces to build).
     """
+    if len(ys_norm) < 2:
+        raise ValueError("empty silhouette")
     # Height scale
     height_m = (height_cm or 170.0) / 100.0
-    y_values = ys_norm * height_m
+    y_values = np.asarray(ys_norm, dtype=np.float64) * height_m
     # Reference half-width in metres
     max_half_px = max(1.0, float(half_widths_px.max()))
     ref_half_m = 0.125 * height_m
-    radii_m = ref_half_m * (half_widths_px / max_half_px)
-
-    # Build rings
-    verts = []
-    faces = []
-    two_pi = 2.0 * math.pi
-    for i, (y_m, r_m) in enumerate(zip(y_values, radii_m)):
-        for j in range(radial_segments):
-            theta = two_pi * j / radial_segments
-            x = r_m * math.cos(theta)
-            z = r_m * math.sin(theta)
-            verts.append((x, y_m, z))
-
-    # Connect rings
-    def idx(i, j):
-        return i * radial_segments + (j % radial_segments)
-
-    for i in range(len(y_values) - 1):
-        for j in range(radial_segments):
-            a = idx(i, j)
-            b = idx(i + 1, j)
-            c = idx(i + 1, j + 1)
-            d = idx(i, j + 1)
-            faces.append((a, b, c))
-            faces.append((a, c, d))
-    mesh = trimesh.Trimesh(
-        vertices=np.array(verts, dtype=np.float32),
-        faces=np.array(faces, dtype=np.int64),
-        process=True,
+    radii_m = ref_half_m * (np.asarray(half_widths_px, dtype=np.float64) / max_half_px)
+    depths_m = radii_m
+    if half_depths_px is not None:
+        depths_m = ref_half_m * (
+            np.asarray(half_depths_px, dtype=np.float64) / max_half_px
+        )
+
+    # Rings: vertex (i, j) at index i * S + j
+    rings = len(y_values)
+    theta = 2.0 * math.pi * np.arange(radial_segments) / radial_segments
+    verts = np.empty((rings, radial_segments, 3), dtype=np.float32)
+    verts[:, :, 0] = radii_m[:, None] * np.cos(theta)[None, :]
+    verts[:, :, 1] = y_values[:, None]
+    verts[:, :, 2] = depths_m[:, None] * np.sin(theta)[None, :]
+
+    # Two triangles per quad between ring i and i + 1
+    i = np.arange(rings - 1, dtype=np.uint32)[:, None]
+    j = np.arange(radial_segments, dtype=np.uint32)[None, :]
+    j1 = (j + 1) % radial_segments
+    a = i * radial_segments + j
+    b = (i + 1) * radial_segments + j
+    c = (i + 1) * radial_segments + j1
+    d = i * radial_segments + j1
+    faces = np.empty((rings - 1, radial_segments, 2, 3), dtype=np.uint32)
+    faces[:, :, 0] = np.stack([a, b, c], axis=-1)
+    faces[:, :, 1] = np.stack([a, c, d], axis=-1)
+    return verts.reshape(-1, 3), faces.reshape(-1, 3)
+
+
+def _mesh_from_profile(
+    ys_norm: np.ndarray,
+    half_widths_px: np.ndarray,
+    bbox: Tuple[int, int, int, int],
+    image_width: int,
+    height_cm: float | None,
+    radial_segments: int = RADIAL_SEGMENTS,
+    half_depths_px: Optional[np.ndarray] = None,
+) -> "trimesh.Trimesh":
+    """The revolved mesh as a processed trimesh (benchmarks / ad-hoc inspection)."""
+    # Not needed on the GLB path, so compute processes never import it
+    import trimesh
+
+    verts, faces = _revolve_profile(
+        ys_norm, half_widths_px, height_cm, radial_segments, half_depths_px
     )
-    return mesh
+    return trimesh.Trimesh(vertices=verts, faces=faces, process=True)
+
+
+def _decode(path: str) -> np.ndarray:
+    return np.array(Image.open(path).convert("RGB"))
+
+
+def _map_views(fn, items: list) -> list:
+    """Apply `fn` to each view, in parallel threads when there is more than one."""
+    if len(items) == 1:
+        return [fn(items[0])]
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(fn, items))
+
+
+def generate_glb_from_images(
+    input_image_paths: Sequence[str],
+    output_glb_path: str,
+    height_cm: float | None = None,
+    timer: Optional[StageTimer] = None,
+) -> None:
+    """Generate a coarse body GLB from a front photo and an optional side photo.
+
+    Views are decoded, segmented and cleaned in parallel (one segmentation graph
+    per thread), so a two-view job costs about as much wall time as a single view.
+    With a side view the cross-sections are ellipses (front width x side depth);
+    with only a front view they are circles. Further views are ignored.
+    """
+    timer = timer or StageTimer()
+    paths = list(input_image_paths[:MAX_INPUT_VIEWS])
+    if not paths:
+        raise ValueError("at least one input image is required")
+    with timer.stage("decode"):
+        images = _map_views(_decode, paths)
+    generate_glb_from_arrays(images, output_glb_path, height_cm, timer)
+
+
+def generate_glb_from_arrays(
+    images: Sequence[np.ndarray],
+    output_glb_path: str,
+    height_cm: float | None = None,
+    timer: Optional[StageTimer] = None,
+) -> None:
+    """`generate_glb_from_images` after decoding: HxWx3 uint8 RGB arrays, front first.
+
+    The arrays are only read, so they may be views of shared memory.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("segmentation"):
+        raw_masks = _map_views(_segment_raw, list(images[:MAX_INPUT_VIEWS]))
+    with timer.stage("morphology"):
+        masks = _map_views(_clean_mask, raw_masks)
+    # Extract profile(s) and build mesh
+    with timer.stage("profile"):
+        if len(masks) > 1:
+            ys_norm, half_widths_px, half_depths_px, bbox = _profiles_from_masks(*masks)
+        else:
+            ys_norm, half_widths_px, bbox = _profile_from_mask(masks[0])
+            half_depths_px = None
+    with timer.stage("mesh"):
+        verts, faces = _revolve_profile(
+            ys_norm, half_widths_px, height_cm, half_depths_px=half_depths_px
+        )
+        normals = vertex_normals(verts, faces) if GLB_NORMALS else None
+    # Export GLB (arrays go straight into the file's BIN chunk)
+    with timer.stage("glb_export"), open(output_glb_path, "wb") as f:
+        write_glb(f, verts, faces, normals)
 
 
 def generate_glb_from_image(
-    input_image_path: str, output_glb_path: str, height_cm: float | None = None
+    input_image_path: str,
+    output_glb_path: str,
+    height_cm: float | None = None,
+    timer: Optional[StageTimer] = None,
 ) -> None:
     """Generate a coarse body GLB from a single image via segmentation + revolution.
 
     This is a lightweight, dependency-free (no large DL models) demo suitable for Track A until
-    we switch to a learned model (e.g., SF3D/TripoSR).
+    we switch to a learned model (e.g., SF3D/TripoSR). Per-stage wall time is recorded
+    on `timer` when given.
     """
-    # Read image (RGB)
-    img = Image.open(input_image_path).convert("RGB")
-    img_rgb = np.array(img)
-    h, w, _ = img_rgb.shape
-    # Segment person
-    mask = _segment_person(img_rgb)
-    # Extract profile and build mesh
-    ys_norm, half_widths_px, bbox = _profile_from_mask(mask)
-    mesh = _mesh_from_profile(ys_norm, half_widths_px, bbox, w, height_cm)
-    # Export GLB
-    glb_bytes = trimesh.exchange.gltf.export_glb(mesh.scene())
-    with open(output_glb_path, "wb") as f:
-        f.write(glb_bytes)
+    generate_glb_from_images([input_image_path], output_glb_path, height_cm, timer)
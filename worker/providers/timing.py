@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Accumulate wall-clock time per named pipeline stage.
+
+    Stages are recorded in first-seen order; re-entering a stage adds to its total
+    (e.g. a provider fallback that decodes the input twice).
+    """
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    def as_ms(self) -> dict[str, float]:
+        return {name: round(secs * 1000.0, 2) for name, secs in self.stages.items()}
@@ -4,10 +4,13 @@ import re
 import shlex
 import subprocess
 import tempfile
+from functools import lru_cache
 from typing import Optional
 
 import trimesh
 
+from .timing import StageTimer
+
 logger = logging.getLogger("rapso-worker")
 
 
@@ -21,8 +24,39 @@ def _have_cli(cmd: list[str]) -> bool:
         return False
 
 
+# Common guesses when TRIPOSR_CMD is not set
+_CANDIDATES = (
+    ("python3", "/opt/triposr/run.py"),
+    ("python", "/opt/triposr/run.py"),
+    ("python3", "-m", "scripts.run"),
+    ("python", "-m", "scripts.run"),
+    ("triposr",),
+)
+
+
+@lru_cache(maxsize=1)
+def _find_cli() -> Optional[tuple[str, ...]]:
+    """First runnable candidate CLI (probed once per process, not per job)."""
+    for c in _CANDIDATES:
+        if _have_cli(list(c)):
+            return c
+    return None
+
+
+def probe() -> bool:
+    """Resolve the TripoSR CLI ahead of the first job; True if one is available."""
+    env_cmd = os.environ.get("TRIPOSR_CMD")
+    if env_cmd:
+        cmd = shlex.split(env_cmd)
+        return bool(cmd) and os.path.isabs(cmd[0]) and os.path.exists(cmd[0])
+    return _find_cli() is not None
+
+
 def generate_glb_from_image(
-    input_image_path: str, output_glb_path: str, height_cm: Optional[float] = None
+    input_image_path: str,
+    output_glb_path: str,
+    height_cm: Optional[float] = None,
+    timer: Optional[StageTimer] = None,
 ) -> None:
     """Attempt to run a TripoSR/SF3D-style pipeline to produce a GLB.
 
@@ -34,7 +68,9 @@ def generate_glb_from_image(
     Expected CLI behaviour (examples):
       python -m scripts.run -i <img> -o <out_dir>  # TripoSR repo style
     We will write output to a temp dir and then pick a .glb result to move to `output_glb_path`.
+    Per-stage wall time is recorded on `timer` when given.
     """
+    timer = timer or StageTimer()
     # Figure out command
     env_cmd = os.environ.get("TRIPOSR_CMD")
     tried = []
@@ -52,22 +88,11 @@ def generate_glb_from_image(
             )
         tried.append("TRIPOSR_CMD")
     else:
-        # Common guesses
-        candidates = [
-            ["python3", "/opt/triposr/run.py"],
-            ["python", "/opt/triposr/run.py"],
-            ["python3", "-m", "scripts.run"],
-            ["python", "-m", "scripts.run"],
-            ["triposr"],
-        ]
-        cmd = None
-        for c in candidates:
-            if _have_cli(c):
-                cmd = c
-                break
+        found = _find_cli()
         tried.extend(["python -m scripts.run", "triposr"])
-        if cmd is None:
+        if found is None:
             raise ImportError(f"TripoSR CLI not found. Tried: {tried}")
+        cmd = list(found)
 
     with tempfile.TemporaryDirectory() as td:
         out_dir = td
@@ -82,7 +107,8 @@ def generate_glb_from_image(
         ]
         logger.info("Running TripoSR: %s", " ".join(full))
         try:
-            subprocess.run(full, check=True)
+            with timer.stage("triposr_inference"):
+                subprocess.run(full, check=True)
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"TripoSR failed: {e}")
 
@@ -108,10 +134,11 @@ def generate_glb_from_image(
             src = candidate_obj or candidate_ply
             if src:
                 logger.info("Converting %s to GLB via trimesh", os.path.basename(src))
-                mesh = trimesh.load(src, force="mesh")
-                glb_bytes = trimesh.exchange.gltf.export_glb(mesh.scene())
-                with open(output_glb_path, "wb") as f:
-                    f.write(glb_bytes)
+                with timer.stage("glb_export"):
+                    mesh = trimesh.load(src, force="mesh")
+                    glb_bytes = trimesh.exchange.gltf.export_glb(mesh.scene())
+                    with open(output_glb_path, "wb") as f:
+                        f.write(glb_bytes)
                 return
             raise FileNotFoundError("TripoSR produced no mesh we can convert to .glb")
         # Move to requested output path if GLB exists already
@@ -0,0 +1,35 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+from providers import silhouette_revolve as sr
+from providers.glb import encode_glb, write_glb
+
+
+def _ellipse_mask(h: int, w: int) -> np.ndarray:
+    yy, xx = np.mgrid[0:h, 0:w]
+    return (((yy - h / 2) / (h * 0.45)) ** 2 + ((xx - w / 2) / (w * 0.3)) ** 2) <= 1.0
+
+
+def test_profile_mesh_and_glb_for_body_mask():
+    ys_norm, half_widths_px, _ = sr._profile_from_mask(_ellipse_mask(256, 128))
+    verts, faces = sr._revolve_profile(ys_norm, half_widths_px, 170.0)
+    assert len(verts) == len(ys_norm) * sr.RADIAL_SEGMENTS
+    assert len(faces) == 2 * (len(ys_norm) - 1) * sr.RADIAL_SEGMENTS
+    glb = encode_glb(verts, faces)
+    magic, version, total = struct.unpack("<III", glb[:12])
+    assert (magic, version, total) == (0x46546C67, 2, len(glb))
+
+
+@pytest.mark.parametrize("mask", [np.ones((1, 1), bool), np.zeros((1, 8), bool)])
+def test_single_ring_silhouette_raises(mask):
+    ys_norm, half_widths_px, _ = sr._profile_from_mask(mask)
+    with pytest.raises(ValueError, match="empty silhouette"):
+        sr._revolve_profile(ys_norm, half_widths_px, 170.0)
+
+
+def test_write_glb_accepts_empty_buffers():
+    f = io.BytesIO()
+    total = write_glb(f, np.zeros((0, 3), np.float32), np.zeros((0, 3), np.uint32))
+    assert total == len(f.getvalue())